@@ -1,13 +1,41 @@
-from .layout import stimBoxes
+from .layout import stimBoxes, layout_positions
+from .atlas import imageAtlas
 from .trial import trial
+from .gaze import gazeSource, simulatedTracker
 from .instruction import instr_brief, instr_loop, instr_input
-from .utils import is_capslock_on
+from .plan import compile_plan, experimentPlan
+from .journal import sessionJournal
+from .telemetry import sessionTelemetry, telemetryReader
+from .randomize import constrained_order, order_trials, generate_orders, counterbalance
+from .stats import runningStats, conditionStats, staircase, questStaircase
+from .station import stationController
+from .utils import is_capslock_on, keyboardMonitor, get_keyboard_monitor
 
 __all__ = [
     "stimBoxes",
+    "layout_positions",
+    "imageAtlas",
     "trial",
+    "gazeSource",
+    "simulatedTracker",
     "instr_brief",
     "instr_loop",
     "is_capslock_on",
-    "instr_input"
+    "keyboardMonitor",
+    "get_keyboard_monitor",
+    "instr_input",
+    "compile_plan",
+    "experimentPlan",
+    "sessionJournal",
+    "sessionTelemetry",
+    "telemetryReader",
+    "constrained_order",
+    "order_trials",
+    "generate_orders",
+    "counterbalance",
+    "runningStats",
+    "conditionStats",
+    "staircase",
+    "questStaircase",
+    "stationController"
 ]
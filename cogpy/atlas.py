@@ -0,0 +1,185 @@
+from PIL import Image
+from pathlib import Path
+from collections import OrderedDict
+import json
+import numpy as np
+from .image import load_image, as_texture
+
+
+class imageAtlas(object):
+    ''' A class to pack a folder of images into a few large pages with a lookup index
+
+    Args:
+        pages (list): the atlas pages as PIL images
+        index (dict): the location of each image. The keys are the image keys,
+            and the values are [page, x, y, width, height] in pixels.
+        maxbytes (int, optional): the maximum size in bytes of the composed panels that are kept for reuse. Defaults to 256 MB.
+
+    Description:
+        An atlas is usually created with `imageAtlas.build` from a folder of images,
+        either at the start of the session or offline with `save` and `load`.
+        The image keys are the paths of the images relative to the folder, without the suffix
+        (e.g., "cat01" or "animals/cat01"). `stimBoxes.stim_image` accepts these keys
+        when the atlas is passed with the `atlas` argument.
+    '''
+
+    suffixes = [".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff"]
+
+    def __init__(self, pages:list, index:dict, maxbytes:int = 256*2**20):
+        self.pages = pages
+        self.index = index
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.panels = OrderedDict()
+
+    @classmethod
+    def build(cls, folder, cell_size = 256, page_size = 2048, draft = True):
+        '''Pack all images in a folder into atlas pages
+
+        Args:
+            folder (str): The folder of the images. Subfolders are included.
+            cell_size (int, optional): The maximum width and height of each image in pixels.
+                Larger images are downscaled to fit. Defaults to 256.
+            page_size (int, optional): The width and height of each atlas page in pixels. Defaults to 2048.
+            draft (bool, optional): Whether to use the Pillow draft mode when decoding the images. Defaults to True.
+
+        Returns:
+            imageAtlas: the atlas
+        '''
+
+        if cell_size > page_size:
+            raise ValueError("The cell size should not be larger than the page size")
+
+        folder = Path(folder)
+        files = sorted(f for f in folder.rglob("*") if f.suffix.lower() in cls.suffixes)
+        if len(files) == 0:
+            raise ValueError(f"No images found in {folder}")
+
+        # decode the images at the cell size
+        images = {}
+        for file in files:
+            key = file.relative_to(folder).with_suffix("").as_posix()
+            if key in images:
+                raise ValueError(f"Duplicate image key: {key}")
+            images[key] = load_image(file, [cell_size, cell_size], draft=draft).convert("RGBA")
+
+        # shelf packing: place the tallest images first, row by row
+        order = sorted(images, key=lambda k: images[k].size[1], reverse=True)
+        index = {}
+        page, x, y, shelfH = 0, 0, 0, 0
+        for key in order:
+            w, h = images[key].size
+            # start a new shelf
+            if x + w > page_size:
+                x, y, shelfH = 0, y + shelfH, 0
+            # start a new page
+            if y + h > page_size:
+                page, x, y, shelfH = page + 1, 0, 0, 0
+            index[key] = [page, x, y, w, h]
+            x += w
+            shelfH = max(shelfH, h)
+
+        # paste the images into the pages
+        pages = [Image.new("RGBA", (page_size, page_size), (0, 0, 0, 0)) for _ in range(page + 1)]
+        for key, (p, x, y, w, h) in index.items():
+            pages[p].paste(images[key], (x, y))
+
+        return cls(pages, index)
+
+    @classmethod
+    def load(cls, folder):
+        '''Load an atlas saved with `save`
+
+        Args:
+            folder (str): The folder of the atlas.
+
+        Returns:
+            imageAtlas: the atlas
+        '''
+
+        folder = Path(folder)
+        with open(folder / "index.json") as f:
+            meta = json.load(f)
+        pages = [Image.open(folder / name).convert("RGBA") for name in meta["pages"]]
+        return cls(pages, meta["index"])
+
+    def save(self, folder):
+        '''Save the atlas pages and the index to a folder
+
+        Args:
+            folder (str): The folder of the atlas.
+        '''
+
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        names = []
+        for i, page in enumerate(self.pages):
+            names.append(f"atlas_{i}.png")
+            page.save(folder / names[-1])
+        with open(folder / "index.json", "w") as f:
+            json.dump({"pages": names, "index": self.index}, f)
+
+    def crop(self, key:str):
+        '''Get an image from the atlas
+
+        Args:
+            key (str): The key of the image.
+
+        Returns:
+            PIL.Image.Image: the image
+        '''
+
+        if key not in self.index:
+            raise ValueError(f"The image {key} is not in the atlas")
+        p, x, y, w, h = self.index[key]
+        return self.pages[p].crop((x, y, x + w, y + h))
+
+    def compose(self, placements:list, size:tuple, cell:tuple):
+        '''Compose atlas images on a transparent panel, as a psychopy texture
+
+        Args:
+            placements (list): The (key, x, y) of each image, with the center of the image in pixels from the top left corner of the panel.
+            size (tuple): The width and height of the panel in pixels.
+            cell (tuple): The maximum width and height of each image in pixels.
+
+        Returns:
+            numpy.ndarray: the texture (see `cogpy.image.as_texture`).
+                The panels of the last image sets are kept, so a repeated image set is neither resized nor composed again.
+        '''
+
+        key = (tuple(placements), tuple(size), tuple(cell))
+        if key in self.panels:
+            self.panels.move_to_end(key)
+            return self.panels[key]
+
+        canvas = Image.new("RGBA", size, (0, 0, 0, 0))
+        for name, x, y in placements:
+            content = self.crop(name)
+            ratio = max(content.size[0]/cell[0], content.size[1]/cell[1])
+            fitted = (max(1, round(content.size[0]/ratio)), max(1, round(content.size[1]/ratio)))
+            canvas.paste(content.resize(fitted, Image.LANCZOS), (x - fitted[0]//2, y - fitted[1]//2))
+
+        texture = as_texture(np.asarray(canvas))
+        self.__store(key, texture)
+        return texture
+
+    def __store(self, key, texture):
+        '''Keep a panel and drop the least recently used ones above the size limit'''
+
+        # a float RGBA panel that covers a full HD window takes about 30 MB
+        if texture.nbytes > self.maxbytes:
+            return
+        self.panels[key] = texture
+        self.nbytes += texture.nbytes
+        while self.nbytes > self.maxbytes:
+            _, old = self.panels.popitem(last=False)
+            self.nbytes -= old.nbytes
+
+    def keys(self):
+        return list(self.index.keys())
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
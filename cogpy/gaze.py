@@ -0,0 +1,170 @@
+"""
+Gaze input for trial. A gaze source delivers the samples recorded since the last poll as one array,
+so that the response loop processes all samples of a frame in one vectorized batch.
+"""
+
+from psychopy import core
+import numpy as np
+
+
+class gazeSource(object):
+    ''' The base class of gaze sources
+
+    Description:
+        A gaze source should implement `poll`, which returns the samples recorded since the last call
+        as an array with one row of [time, x, y] per sample. The time is on the clock of psychopy's
+        core.getTime(), and the position is in height units with [0, 0] at the center of the window.
+        Samples without a valid position (e.g., blinks) should have NaN positions.
+        To use an eye tracker, wrap its sample buffer in a subclass of gazeSource.
+    '''
+
+    def start(self):
+        '''Start the recording'''
+        pass
+
+    def stop(self):
+        '''Stop the recording'''
+        pass
+
+    def poll(self):
+        '''Get the samples recorded since the last poll
+
+        Returns:
+            numpy.ndarray: the samples, one row of [time, x, y] per sample
+        '''
+        raise NotImplementedError
+
+
+class simulatedTracker(gazeSource):
+    ''' A simulated eye tracker for testing
+
+    Args:
+        rate (float, optional): the sampling rate in Hz. Defaults to 1000.
+        path (callable | list, optional): the gaze path.
+            Either a function that takes an array of times (relative to `start`) and returns an array of positions,
+            or a list of [onset, [x, y]] fixations. Defaults to the center of the window.
+        noise (float, optional): the standard deviation of the gaze noise in height units. Defaults to 0.
+        seed (int, optional): the random seed of the noise. Defaults to None.
+    '''
+
+    def __init__(self, rate:float = 1000, path = None, noise:float = 0, seed = None):
+        self.rate = rate
+        self.path = [[0, [0, 0]]] if path is None else path
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.start()
+
+    def start(self):
+        '''Start the recording from the current time'''
+        self.start_time = core.getTime()
+        self.count = 0
+
+    def positions(self, t):
+        '''Get the gaze positions at the times t (relative to `start`)'''
+
+        if callable(self.path):
+            return np.asarray(self.path(t), dtype=float).reshape(len(t), 2)
+
+        onsets = np.array([p[0] for p in self.path], dtype=float)
+        targets = np.array([p[1] for p in self.path], dtype=float)
+        current = np.clip(np.searchsorted(onsets, t, side="right") - 1, 0, None)
+        return targets[current]
+
+    def poll(self):
+        '''Get the samples that were due since the last poll'''
+
+        # the number of samples due since the start
+        due = int((core.getTime() - self.start_time)*self.rate) + 1
+        t = np.arange(self.count, due)/self.rate
+        self.count = max(self.count, due)
+
+        xy = self.positions(t)
+        if self.noise > 0:
+            xy = xy + self.rng.normal(0, self.noise, xy.shape)
+
+        return np.column_stack([t + self.start_time, xy])
+
+
+def hit_test(xy, centers, sizes):
+    '''Find the box that contains each gaze sample
+
+    Args:
+        xy (numpy.ndarray): The gaze positions, one row of [x, y] per sample.
+        centers (numpy.ndarray): The centers of the boxes, one row of [x, y] per box.
+        sizes (numpy.ndarray): The sizes of the boxes, one row of [width, height] per box.
+
+    Returns:
+        numpy.ndarray: the index of the box that contains each sample, -1 if none,
+            or -2 if the sample has no valid position (NaN, e.g., a blink).
+            If boxes overlap, the first box is returned.
+    '''
+
+    inside = np.all(np.abs(xy[:, None, :] - centers[None, :, :]) <= sizes[None, :, :]/2, axis=2)
+    boxes = np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+    boxes[np.isnan(xy).any(axis=1)] = -2
+    return boxes
+
+
+class fixationDetector(object):
+    ''' Detect when the gaze dwells in a box for a minimum duration
+
+    Args:
+        duration (float): the minimum fixation duration in seconds.
+        max_gap (float, optional): the longest gap in the valid samples (e.g., a blink) that does not break a fixation,
+            in seconds. Defaults to 0.1.
+    '''
+
+    def __init__(self, duration:float, max_gap:float = 0.1):
+        self.duration = duration
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        '''Forget the current fixation'''
+        self.box = -1
+        self.onset = None
+        self.last_time = None
+
+    def update(self, t, boxes):
+        '''Process a batch of samples
+
+        Args:
+            t (numpy.ndarray): The times of the samples.
+            boxes (numpy.ndarray): The box index of each sample (from `hit_test`).
+                Samples without a valid position (-2) are skipped, so a blink shorter than `max_gap` does not break a fixation.
+
+        Returns:
+            tuple | None: the (box index, fixation onset, time the duration was reached) of the first completed fixation,
+                or None if no fixation was completed in the batch.
+        '''
+
+        # skip the samples without a valid position
+        valid = boxes != -2
+        t, boxes = t[valid], boxes[valid]
+        if len(t) == 0:
+            return None
+
+        # a new run starts when the box changes or the samples have a gap
+        prev_box = np.concatenate([[self.box], boxes[:-1]])
+        prev_t = np.concatenate([[t[0] if self.last_time is None else self.last_time], t[:-1]])
+        new_run = (boxes != prev_box) | (t - prev_t > self.max_gap)
+        if self.onset is None:
+            new_run[0] = True
+
+        # the onset of the run of each sample
+        run_start = np.maximum.accumulate(np.where(new_run, np.arange(len(t)), 0))
+        onsets = t[run_start]
+        if not new_run[0]:
+            onsets[run_start == 0] = self.onset
+
+        # the first sample that completes a fixation
+        done = np.flatnonzero((boxes >= 0) & (t - onsets >= self.duration))
+
+        self.box = boxes[-1]
+        self.onset = onsets[-1]
+        self.last_time = t[-1]
+
+        if len(done) == 0:
+            return None
+        i = done[0]
+        return int(boxes[i]), float(onsets[i]), float(t[i])
@@ -0,0 +1,109 @@
+"""
+Vectorized geometry checks for box layouts. The centers and sizes of the boxes are arrays
+with one row of [x, y] (or [width, height]) per box, in height units.
+"""
+
+import numpy as np
+
+
+def find_overlaps(centers, sizes, margin:float = 0):
+    '''Find the pairs of boxes that overlap, with a uniform grid hash
+
+    Args:
+        centers (numpy.ndarray): The centers of the boxes, one row of [x, y] per box.
+        sizes (numpy.ndarray): The sizes of the boxes, one row of [width, height] per box (or a single [width, height]).
+        margin (float, optional): The minimum gap between two boxes. Defaults to 0 (boxes may touch).
+
+    Returns:
+        numpy.ndarray: the overlapping pairs, one row of [i, j] (with i < j) per pair
+
+    Description:
+        The cells of the grid are as large as the largest box, so a box can only overlap the boxes
+        of its own cell and of the neighboring cells. For boxes of similar sizes, the number of candidate pairs
+        grows with the number of boxes (and of overlaps), in any arrangement (lines, columns, or grids).
+    '''
+
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=float), centers.shape)
+    low = centers - sizes/2 - margin/2
+    high = centers + sizes/2 + margin/2
+    eps = 1e-9 # boxes that only touch do not overlap
+    if len(centers) < 2:
+        return np.zeros((0, 2), dtype=int)
+
+    # the cell of the bottom left corner of each box (with an empty border of cells)
+    cell = (high - low).max(axis=0)
+    cell[cell <= 0] = 1
+    ij = np.floor((low - low.min(axis=0))/cell).astype(np.int64) + 1
+    stride = ij[:, 1].max() + 2
+    keys = ij[:, 0]*stride + ij[:, 1]
+
+    # the boxes of each cell, as a range of the boxes sorted by cell
+    order = np.argsort(keys, kind="stable")
+    cells, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    # the candidate pairs of each cell and the next cells (each pair of neighboring cells once)
+    pairs_i, pairs_j = [], []
+    for dx, dy in [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]:
+        other = cells + dx*stride + dy
+        pos = np.minimum(np.searchsorted(cells, other), len(cells) - 1)
+        a = np.flatnonzero(cells[pos] == other)
+        b = pos[a]
+        na, nb = counts[a], counts[b]
+        total = na*nb
+        k = np.arange(total.sum()) - np.repeat(np.cumsum(total) - total, total)
+        ia = np.repeat(starts[a], total) + k // np.repeat(nb, total)
+        jb = np.repeat(starts[b], total) + k % np.repeat(nb, total)
+        if dx == 0 and dy == 0:
+            keep = ia < jb
+            ia, jb = ia[keep], jb[keep]
+        pairs_i.append(order[ia])
+        pairs_j.append(order[jb])
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+
+    # keep the pairs that overlap along both axes
+    hit = np.all((low[i] < high[j] - eps) & (low[j] < high[i] - eps), axis=1)
+    pairs = np.sort(np.stack([i[hit], j[hit]], axis=1), axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def find_off_screen(centers, sizes, bounds):
+    '''Find the boxes that are not entirely inside an area
+
+    Args:
+        centers (numpy.ndarray): The centers of the boxes, one row of [x, y] per box.
+        sizes (numpy.ndarray): The sizes of the boxes, one row of [width, height] per box (or a single [width, height]).
+        bounds (list): The area, as [left, bottom, right, top].
+
+    Returns:
+        numpy.ndarray: the indices of the boxes
+    '''
+
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=float), centers.shape)
+    bounds = np.asarray(bounds, dtype=float)
+    eps = 1e-9
+
+    out = np.any(centers - sizes/2 < bounds[:2] - eps, axis=1) | np.any(centers + sizes/2 > bounds[2:] + eps, axis=1)
+    return np.flatnonzero(out)
+
+
+def check_boxes(names:list, centers, sizes, bounds, margin:float = 0):
+    '''Check a layout for overlapping boxes and boxes outside the window
+
+    Args:
+        names (list): The names of the boxes.
+        centers (numpy.ndarray): The centers of the boxes, one row of [x, y] per box.
+        sizes (numpy.ndarray): The sizes of the boxes, one row of [width, height] per box (or a single [width, height]).
+        bounds (list): The window, as [left, bottom, right, top].
+        margin (float, optional): The minimum gap between two boxes. Defaults to 0.
+
+    Returns:
+        dict: the overlapping pairs of box names ("overlaps") and the names of the boxes outside the window ("off_screen")
+    '''
+
+    return {
+        "overlaps": [(names[i], names[j]) for i, j in find_overlaps(centers, sizes, margin)],
+        "off_screen": [names[i] for i in find_off_screen(centers, sizes, bounds)],
+    }
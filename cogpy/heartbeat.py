@@ -0,0 +1,16 @@
+"""
+A heartbeat of the response loops.
+
+Each iteration of a response loop of `trial`, `instr_brief`, `instr_loop` and `instr_input` calls `beat()`,
+so a monitor (e.g., the health reports of a `stationController` station) can tell a session
+that waits for a response without flipping from a session that stopped.
+"""
+
+beats = 0
+
+
+def beat():
+    '''Count an iteration of a response loop'''
+
+    global beats
+    beats += 1
@@ -0,0 +1,153 @@
+from PIL import Image
+from pathlib import Path
+import hashlib
+import numpy as np
+
+
+def fit_size(size, target):
+    '''Calculate the largest size that keeps the aspect ratio and fits in the target
+
+    Args:
+        size (list): The original size [width, height] in pixels.
+        target (list): The target size [width, height] in pixels.
+
+    Returns:
+        tuple: the fitted size in pixels, or the original size if it already fits.
+    '''
+
+    ratio = min(target[0]/size[0], target[1]/size[1])
+    if ratio >= 1:
+        return (int(size[0]), int(size[1]))
+    return (max(1, round(size[0]*ratio)), max(1, round(size[1]*ratio)))
+
+
+def load_image(path, size=None, draft=True, cache_dir=None):
+    '''Decode an image file downscaled to the target pixel size
+
+    Args:
+        path (str): The path of the image file.
+        size (list, optional): The target size [width, height] in pixels.
+            The image is shrunk to fit in the target while keeping its aspect ratio.
+            Images that already fit are never enlarged. Defaults to None (full resolution).
+        draft (bool, optional): Whether to use the Pillow draft mode.
+            The JPEG decoder then scales the image by 1/2, 1/4 or 1/8 while decoding,
+            which is much faster than decoding the full image. Defaults to True.
+        cache_dir (str, optional): The folder for the pyramid cache.
+            If provided, the image is stored at the nearest power-of-two level above the target,
+            so that the next session only decodes the small level. Defaults to None.
+
+    Returns:
+        PIL.Image.Image: the decoded image
+    '''
+
+    img = Image.open(path)
+    if size is None:
+        return img
+
+    target = fit_size(img.size, size)
+    if target == img.size:
+        return img
+
+    # the pyramid level is the number of halvings that still keeps the target size
+    level = int(np.floor(np.log2(min(img.size[0]/target[0], img.size[1]/target[1]))))
+
+    if cache_dir is not None and level > 0:
+        img = _load_level(path, img, level, draft, cache_dir)
+    elif draft:
+        img.draft(img.mode if img.mode in ["RGB", "L"] else "RGB", target)
+
+    return img.resize(target, Image.LANCZOS)
+
+
+def _load_level(path, img, level, draft, cache_dir):
+    '''Load a pyramid level from the cache, or decode and store it
+
+    Args:
+        path (str): The path of the image file.
+        img (PIL.Image.Image): The opened (but not decoded) image.
+        level (int): The pyramid level. The level size is the original size divided by 2**level.
+        draft (bool): Whether to use the Pillow draft mode.
+        cache_dir (str): The folder for the pyramid cache.
+    '''
+
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = hashlib.sha1(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+
+    cache_dir = Path(cache_dir)
+    cache_file = cache_dir / f"{path.stem}_{key}_L{level}.png"
+    if cache_file.exists():
+        return Image.open(cache_file)
+
+    # decode and resize the image to the level size
+    levelSize = (max(1, img.size[0] >> level), max(1, img.size[1] >> level))
+    if draft:
+        img.draft(img.mode if img.mode in ["RGB", "L"] else "RGB", levelSize)
+    img = img.resize(levelSize, Image.LANCZOS)
+
+    # store the level in the cache
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    img.save(cache_file)
+
+    return img
+
+
+def is_image_array(image):
+    '''Whether an image is an array (a NumPy array, a memory-mapped array, or an object with the buffer protocol) rather than a path'''
+
+    if isinstance(image, (str, Path)):
+        return False
+    if isinstance(image, np.ndarray) or hasattr(image, "__array_interface__") or hasattr(image, "__array__"):
+        return True
+    try:
+        memoryview(image)
+    except TypeError:
+        return False
+    return True
+
+
+def as_texture(image):
+    '''Convert an image array to a psychopy texture
+
+    Args:
+        image (array): The image, with the shape [height, width], [height, width, 3] (RGB), or [height, width, 4] (RGBA),
+            and the first row at the top. Integer images use the full range of their type (e.g., 0-255 for uint8),
+            and float images should already be in the range of psychopy textures (-1 to 1).
+
+    Returns:
+        numpy.ndarray: the texture, with the first row at the bottom as in OpenGL.
+            Float images are returned as a flipped view without a copy,
+            and other images are converted in a single float32 copy.
+    '''
+
+    array = np.asarray(image) # a view of memory-mapped arrays and buffers
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[:, :, 0]
+    if array.ndim not in [2, 3] or (array.ndim == 3 and array.shape[2] not in [3, 4]):
+        raise ValueError("The image arrays should have the shape [height, width], [height, width, 3], or [height, width, 4]")
+
+    if array.dtype == bool:
+        array = np.where(array, np.float32(1), np.float32(-1))
+    elif np.issubdtype(array.dtype, np.integer):
+        info = np.iinfo(array.dtype)
+        scale = 2/(float(info.max) - float(info.min))
+        array = array.astype(np.float32)
+        array *= scale
+        array -= 1 + info.min*scale
+    elif not np.issubdtype(array.dtype, np.floating):
+        raise ValueError("The image arrays should have a numeric type")
+
+    return array[::-1]
+
+
+def open_bank(path):
+    '''Open a stimulus bank saved with numpy.save, without reading it into memory
+
+    Args:
+        path (str): The path of the .npy file, with the shape [n, height, width] or [n, height, width, channels].
+
+    Returns:
+        numpy.memmap: the bank. Each image (e.g., `bank[i]`) is read from the disk when it is used.
+    '''
+
+    return np.load(path, mmap_mode="r")
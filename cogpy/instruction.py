@@ -1,5 +1,8 @@
 from psychopy import core, visual, event
 from .layout import stimBoxes
+from .image import load_image
+from .profiling import profiled, span, total
+from .heartbeat import beat
 from pathlib import Path
 
 
@@ -14,13 +17,17 @@ class instr_brief(object):
             If the resp_type is "key", then it should be a list of keys. 
             If the resp_type is "button", then it should be a list of strings. 
             If the resp_type is "mouse", then it should be None
-        adaptive (bool): whether the image should be adaptive to the window size
+        adaptive (bool): whether the image should be adaptive to the window size.
+            The image is then decoded at the pixel size of the window instead of its full resolution
+        draft (bool): whether to use the Pillow draft mode when decoding the image
+        cache_dir (str): the folder for the pyramid cache of the decoded image
         resp_start (float): the time to wait before the response can be made
         duration (float): the maximum duration of the instruction
         **args: additional arguments for the text or image object
     '''
     
-    def __init__(self, win, content:str, resp_type = "key", choice=None, adaptive=True, resp_start = 0.5, duration = float('inf'), button_args=None, quit_key = "escape", **args):
+    @profiled("instr_brief")
+    def __init__(self, win, content:str, resp_type = "key", choice=None, adaptive=True, resp_start = 0.5, duration = float('inf'), button_args=None, quit_key = "escape", draft=True, cache_dir=None, **args):
         
         self.win = win
         self.content = content
@@ -30,8 +37,12 @@ class instr_brief(object):
         self.resp_start = resp_start
         self.duration = duration
         self.adaptive = adaptive
+        self.draft = draft
+        self.cache_dir = cache_dir
         self.args = args
         self.button_args = {} if button_args is None else button_args
+        self.rt = None
+        self.start_time = None # the time from which the RT is measured
         
         if resp_type not in ["key", "button", "mouse"]:
             raise ValueError("Invalid response type")
@@ -43,8 +54,14 @@ class instr_brief(object):
     
     def __display_image(self):
         
-         # create the image object
-        image = visual.ImageStim(self.win, image=str(self.content), units='norm', **self.args)
+        # decode the image at the pixel size of the window
+        if self.adaptive:
+            content = load_image(str(self.content), self.win.size, draft=self.draft, cache_dir=self.cache_dir)
+        else:
+            content = str(self.content)
+        
+        # create the image object
+        image = visual.ImageStim(self.win, image=content, units='norm', **self.args)
 
         # adapt the image size to the window size
         if self.adaptive:
@@ -79,6 +96,7 @@ class instr_brief(object):
         elif self.resp_type == "mouse":
             self.__mouse_response()
         
+    @profiled("instr_brief.key_response")
     def __key_response(self):
         
         # check if the choice is a list
@@ -87,25 +105,34 @@ class instr_brief(object):
         elif isinstance(self.choice, str):
             self.choice = [self.choice]
         
-        self.win.flip()
-        core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
+        with span("instr.flip"):
+            self.win.flip()
+        with span("instr.lockout"):
+            core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
         event.clearEvents() # clear events
         
         start_time = core.getTime() # start timing
+        self.start_time = start_time
         
-        while (core.getTime() - start_time) <= self.duration:
-            
-            keys = event.getKeys()
-            
-            if self.quit_key in keys:
-                self.win.close()
-                core.quit()
-            
-            if set(keys).intersection(self.choice):
-                break
+        poll = total("instr.poll")
+        with span("instr_brief.key_loop"):
+            while (core.getTime() - start_time) <= self.duration:
+                beat()
+                
+                with poll:
+                    keys = event.getKeys()
+                
+                if self.quit_key in keys:
+                    self.win.close()
+                    core.quit()
+                
+                if set(keys).intersection(self.choice):
+                    break
+        poll.record()
         
         self.rt = core.getTime() - start_time
     
+    @profiled("instr_brief.button_response")
     def __button_response(self):
         
         width = 0.05
@@ -126,11 +153,14 @@ class instr_brief(object):
         
         # get the start time of the trial
         start_time = core.getTime() 
+        self.start_time = start_time
         
         # Present stimulation but prohibit response
         self.button.draw()
-        self.win.flip()
-        core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
+        with span("instr.flip"):
+            self.win.flip()
+        with span("instr.lockout"):
+            core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
         event.clearEvents() # clear events
 
         # initialize the loop
@@ -138,41 +168,57 @@ class instr_brief(object):
         mouse = event.Mouse()
         
         # Present stimulation and allow response
-        while loop:
-            
-            keys = event.getKeys()
-            
-            if self.quit_key in keys:
-                self.win.close()
-                core.quit()
-            
-            for button in self.button.boxes:
+        poll = total("instr.poll")
+        with span("instr_brief.button_loop"):
+            while loop:
+                beat()
                 
-                if mouse.isPressedIn(self.button.boxes[button], buttons=[0]):
-                    self.rt = core.getTime() - start_time
-                    
-                    loop = False# initialize the loop
+                with poll:
+                    keys = event.getKeys()
                 
-            # check if the time is over
-            if core.getTime() - start_time > self.duration:
-                loop = False
+                if self.quit_key in keys:
+                    self.win.close()
+                    core.quit()
+                
+                with poll:
+                    for button in self.button.boxes:
+                        
+                        if mouse.isPressedIn(self.button.boxes[button], buttons=[0]):
+                            self.rt = core.getTime() - start_time
+                            
+                            loop = False# initialize the loop
+                    
+                # check if the time is over
+                if core.getTime() - start_time > self.duration:
+                    loop = False
+        poll.record()
     
+    @profiled("instr_brief.mouse_response")
     def __mouse_response(self):
         
-        self.win.flip()
-        core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
+        with span("instr.flip"):
+            self.win.flip()
+        with span("instr.lockout"):
+            core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
         event.clearEvents() # clear events
             
         start_time = core.getTime() # start timing
+        self.start_time = start_time
         mouse = event.Mouse() # initialize mouse
 
         # wait for mouse click or until max duration
-        while (core.getTime() - start_time) <= self.duration:
+        poll = total("instr.poll")
+        with span("instr_brief.mouse_loop"):
+            while (core.getTime() - start_time) <= self.duration:
+                beat()
 
-            # if left mouse button is pressed, then break the loop
-            if mouse.getPressed()[0]:
-                self.rt = core.getTime() - start_time
-                break
+                # if left mouse button is pressed, then break the loop
+                with poll:
+                    pressed = mouse.getPressed()[0]
+                if pressed:
+                    self.rt = core.getTime() - start_time
+                    break
+        poll.record()
         
         
     def get_rt(self):
@@ -180,7 +226,8 @@ class instr_brief(object):
 
 class instr_loop(object):
     
-    def __init__(self, win, contents:list, resp_type = "key", adaptive=True, resp_start = 0.5, duration = float('inf'), quit_key = "escape", button_args={}, text_args={}, image_args={}):
+    @profiled("instr_loop")
+    def __init__(self, win, contents:list, resp_type = "key", adaptive=True, resp_start = 0.5, duration = float('inf'), quit_key = "escape", button_args={}, text_args={}, image_args={}, draft=True, cache_dir=None):
         
         self.win = win
         self.contents = contents
@@ -188,6 +235,8 @@ class instr_loop(object):
         self.resp_start = resp_start
         self.duration = duration
         self.adaptive = adaptive
+        self.draft = draft
+        self.cache_dir = cache_dir
         self.quit_key = quit_key
         self.button_args = button_args
         self.text_args = text_args
@@ -210,8 +259,14 @@ class instr_loop(object):
                 
     def __display_image(self, image):
         
-         # create the image object
-        image = visual.ImageStim(self.win, image=str(image), units='norm', **self.image_args)
+        # decode the image at the pixel size of the window
+        if self.adaptive:
+            image = load_image(str(image), self.win.size, draft=self.draft, cache_dir=self.cache_dir)
+        else:
+            image = str(image)
+        
+        # create the image object
+        image = visual.ImageStim(self.win, image=image, units='norm', **self.image_args)
 
         # adapt the image size to the window size
         if self.adaptive:
@@ -250,24 +305,37 @@ class instr_loop(object):
         
         return manipulation
     
+    @profiled("instr_loop.key_response")
     def __key_response(self):
         
-        self.win.flip()
-        core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
+        with span("instr.flip"):
+            self.win.flip()
+        with span("instr.lockout"):
+            core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
         event.clearEvents() # clear events
         
-        while True:
+        poll = total("instr.poll")
+        with span("instr_loop.key_loop"):
+            while True:
+                beat()
+                
+                with poll:
+                    keys = event.getKeys()
             
-            keys = event.getKeys()
-        
-            if "right" in keys:
-                return "right"
-            elif "left" in keys:
-                return "left"
-            elif self.quit_key in keys:
-                self.win.close()
-                core.quit()
+                if "right" in keys:
+                    response = "right"
+                    break
+                elif "left" in keys:
+                    response = "left"
+                    break
+                elif self.quit_key in keys:
+                    self.win.close()
+                    core.quit()
+        poll.record()
+        
+        return response
     
+    @profiled("instr_loop.button_response")
     def __button_response(self):
         
         width = 0.05
@@ -286,8 +354,10 @@ class instr_loop(object):
         
         # Present stimulation but prohibit response
         self.buttons.draw()
-        self.win.flip()
-        core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
+        with span("instr.flip"):
+            self.win.flip()
+        with span("instr.lockout"):
+            core.wait(self.resp_start) # wait for 0.5 second to avoid accidental touch
         event.clearEvents() # clear events
 
         # initialize the loop
@@ -295,28 +365,35 @@ class instr_loop(object):
         mouse = event.Mouse()
         
         # Present stimulation and allow response
-        while loop:
-            
-            keys = event.getKeys()
-            
-            if self.quit_key in keys:
-                self.win.close()
-                core.quit()
-            
-            for button in self.buttons.boxes:
+        poll = total("instr.poll")
+        with span("instr_loop.button_loop"):
+            while loop:
+                beat()
                 
-                if mouse.isPressedIn(self.buttons.boxes[button], buttons=[0]):
-                    response = self.buttons.text[button].text
-                    loop = False # initialize the loop
+                with poll:
+                    keys = event.getKeys()
                 
-            # check if the time is over
-            if core.getTime() - start_time > self.duration:
-                loop = False
+                if self.quit_key in keys:
+                    self.win.close()
+                    core.quit()
+                
+                with poll:
+                    for button in self.buttons.boxes:
+                        
+                        if mouse.isPressedIn(self.buttons.boxes[button], buttons=[0]):
+                            response = self.buttons.text[button].text
+                            loop = False # initialize the loop
+                    
+                # check if the time is over
+                if core.getTime() - start_time > self.duration:
+                    loop = False
+        poll.record()
         
         return response
 
 
     
+@profiled("instr_input")
 def instr_input(win, question, choice='enter', allowEmpty = True, duration = float('inf'), quit_key="escape", **args):
     ''' Display a screen to ask the participant to input the information.
 
@@ -370,30 +447,37 @@ def instr_input(win, question, choice='enter', allowEmpty = True, duration = flo
     loop = True
     start_time = core.getTime()
     
-    while loop:
-        
-        if core.getTime() - start_time > duration:
-            loop = False
-        
-        for key in event.getKeys():
+    poll = total("instr.poll")
+    with span("instr_input.loop"):
+        while loop:
+            beat()
             
-            if key == 'backspace':
-                answer_text.text = answer_text.text[:-1]
-            elif key == choice:
-                if not allowEmpty and answer_text.text == '':
-                    continue
-                else:
-                    result = answer_text.text
-                    loop = False
-            elif key in [chr(i) for i in range(97,123)]+[str(i) for i in range(11)]:
-                answer_text.text += key.upper()
-            elif key == quit_key:
-                win.close()
-                core.quit()
+            if core.getTime() - start_time > duration:
+                loop = False
             
-        question_text.draw()
-        answer_text.draw()
-        tip_text.draw()
-        win.flip()
+            with poll:
+                keys = event.getKeys()
+            for key in keys:
+                
+                if key == 'backspace':
+                    answer_text.text = answer_text.text[:-1]
+                elif key == choice:
+                    if not allowEmpty and answer_text.text == '':
+                        continue
+                    else:
+                        result = answer_text.text
+                        loop = False
+                elif key in [chr(i) for i in range(97,123)]+[str(i) for i in range(11)]:
+                    answer_text.text += key.upper()
+                elif key == quit_key:
+                    win.close()
+                    core.quit()
+                
+            question_text.draw()
+            answer_text.draw()
+            tip_text.draw()
+            with span("instr.flip"):
+                win.flip()
+    poll.record()
     
     return result
@@ -0,0 +1,236 @@
+from pathlib import Path
+import atexit
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def _to_json(value):
+    '''Convert the values that json cannot encode (e.g., numpy arrays and numbers)'''
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class sessionJournal(object):
+    ''' An append-only journal of completed trials for crash-safe sessions
+
+    Args:
+        path (str): the path of the journal file. An existing journal is replayed, and new records are appended to it.
+        fsync_every (int, optional): the number of records between two syncs to the disk. Defaults to 10.
+        fsync_interval (float, optional): the maximum time between two syncs to the disk in seconds. Defaults to 1.
+        chunk_size (int, optional): the number of bytes that are allocated at once when the file is full. Defaults to 1 MB.
+
+    Description:
+        Each record is one line of JSON. The file is allocated in chunks, so appending a record
+        only writes the line to the operating system, which keeps it when the session process crashes.
+        The records are synced to the disk (against a crash of the machine) every `fsync_every` records,
+        by a background thread at most `fsync_interval` seconds after they were appended, and when the journal is closed
+        (including when the session ends with core.quit()). The unused end of the file is filled with zero bytes,
+        and a line that was only partly written when the session crashed is ignored when the journal is replayed.
+        A journal can be bound to the plan that writes it (see `bind`), so that it is not resumed with another plan.
+    '''
+
+    def __init__(self, path, fsync_every:int = 10, fsync_interval:float = 1, chunk_size:int = 2**20):
+
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.chunk_size = chunk_size
+
+        # replay the existing records
+        self.records = []
+        self.header = None
+        self.offset = 0
+        self.used = 0
+        if self.path.exists():
+            self.__replay()
+
+        self.file = open(self.path, "r+b" if self.path.exists() else "w+b")
+        self.allocated = os.fstat(self.file.fileno()).st_size
+
+        # clear a partly written record, so that it is not mixed with the next record
+        if self.used > self.offset:
+            self.file.seek(self.offset)
+            self.file.write(b"\0"*(self.used - self.offset))
+            self.file.flush()
+        self.file.seek(self.offset)
+        self.pending = 0
+        self.last_sync = time.monotonic()
+        self.lock = threading.Lock()
+
+        # sync the appended records in the background, even when no record follows them
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__sync_loop, daemon=True)
+        self.thread.start()
+
+        atexit.register(self.close)
+
+    def __sync_loop(self):
+
+        while not self.stopped.wait(self.fsync_interval):
+            if self.pending > 0:
+                self.sync()
+
+    def __replay(self):
+
+        data = self.path.read_bytes()
+        end = data.find(b"\0")
+        data = data if end < 0 else data[:end]
+        self.used = len(data)
+
+        # the complete lines, without a partly written record at the end of the journal
+        for line in data.split(b"\n")[:-1]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not isinstance(record, dict):
+                break
+            if "journal_header" in record and self.offset == 0:
+                self.header = record["journal_header"]
+            else:
+                self.records.append(record)
+            self.offset += len(line) + 1
+
+    def __allocate(self, size:int):
+
+        new_size = self.allocated + max(self.chunk_size, size)
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(self.file.fileno(), self.allocated, new_size - self.allocated)
+        else:
+            self.file.truncate(new_size)
+            self.file.seek(self.offset)
+        self.allocated = new_size
+
+    def append(self, record:dict):
+        '''Append a record to the journal
+
+        Args:
+            record (dict): The record, usually a trial result with a "trial_index".
+        '''
+
+        self.__write(record)
+        self.file.flush()
+        self.records.append(record)
+        self.pending += 1
+
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def __write(self, record:dict):
+
+        line = json.dumps(record, default=_to_json).encode() + b"\n"
+        if self.offset + len(line) > self.allocated:
+            self.file.flush()
+            self.__allocate(len(line))
+
+        self.file.write(line)
+        self.offset += len(line)
+
+    def bind(self, key:str):
+        '''Bind the journal to a plan
+
+        Args:
+            key (str): The key of the plan (`experimentPlan.key`). A new journal stores the key in its header.
+
+        Raises:
+            ValueError: The journal was written by another plan, or by a session without a plan.
+        '''
+
+        if self.header is None and self.offset == 0:
+            self.header = {"plan": key}
+            self.__write({"journal_header": self.header})
+            self.sync()
+        elif self.header is None:
+            raise ValueError(f"The journal {self.path} was not written by a plan and cannot be resumed with one")
+        elif self.header.get("plan") != key:
+            raise ValueError(f"The journal {self.path} was written by another plan (a changed spec or another seed) and cannot be resumed with this plan")
+
+    def sync(self):
+        '''Write the buffered records to the disk'''
+
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = 0
+            self.last_sync = time.monotonic()
+
+    def close(self):
+        '''Write the buffered records to the disk and close the journal'''
+
+        if self.file.closed:
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.sync()
+        with self.lock:
+            self.file.close()
+        atexit.unregister(self.close)
+
+    def completed(self):
+        '''The indices of the completed trials
+
+        Returns:
+            set: the trial indices of the records
+        '''
+
+        return {record["trial_index"] for record in self.records if "trial_index" in record}
+
+    def next_trial(self):
+        '''The index of the first trial that is not completed
+
+        Returns:
+            int: the trial index
+        '''
+
+        done = self.completed()
+        index = 0
+        while index in done:
+            index += 1
+        return index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _crash(path, n):
+    '''Append n records and end the process without closing the journal (for the self-check)'''
+
+    journal = sessionJournal(path, fsync_every=1000, fsync_interval=1000)
+    for i in range(n):
+        journal.append({"trial_index": i})
+    os._exit(1)
+
+
+def main(argv = None):
+    '''Check that the records of a session that crashed are replayed'''
+
+    parser = argparse.ArgumentParser(description="Check that a journal keeps the records of a crashed session")
+    parser.add_argument("-n", type=int, default=5, help="the number of records before the crash")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "check.journal")
+        code = f"from cogpy.journal import _crash; _crash({path!r}, {args.n})"
+        subprocess.run([sys.executable, "-c", code], check=False)
+        journal = sessionJournal(path)
+        replayed = len(journal.records)
+        journal.close()
+
+    print(f"{replayed} of {args.n} records replayed after the crash")
+    raise SystemExit(0 if replayed == args.n else 1)
+
+
+if __name__ == "__main__":
+    main()
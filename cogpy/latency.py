@@ -0,0 +1,339 @@
+"""
+End-to-end response latency tests with synthetic input.
+
+A `virtualInput` injects key presses and mouse clicks at scheduled times from a background thread,
+and records the time of each injection. The harness runs `trial`, `instr_brief` and `instr_input`
+against these events and compares the RT they report with the true RT (the injection time minus the onset),
+so the error of the response loops (polling, the lockout, flips) becomes a distribution of numbers:
+
+    win = visual.Window(size=[1600,900], color=[1,1,1], fullscr=False)
+    report = run_latency_suite(win, n=100)
+
+or from the command line (`xvfb-run -a python -m cogpy.latency` on a headless machine).
+
+Two backends are available. "emulated" adds the events to the psychopy event buffers, as psychopy
+does for its own tests, so it measures the response loops but not the operating system.
+"xdotool" sends the events through the X server, so it also measures the input path of the OS,
+including the start of the xdotool process for each event (an upper bound of a few ms).
+"""
+
+from psychopy import core, event, visual
+from .layout import stimBoxes
+from .trial import trial
+from .instruction import instr_brief, instr_input
+import argparse
+import shutil
+import subprocess
+import threading
+import time
+import numpy as np
+
+_xdotool_keys = {"return": "Return", "escape": "Escape", "backspace": "BackSpace", "space": "space"}
+
+
+class virtualInput(object):
+    ''' Inject keyboard and mouse events at known times
+
+    Args:
+        win (object): the window object from psychopy
+        backend (str, optional): "emulated" or "xdotool". Defaults to "emulated".
+        hold (float, optional): the time between the press and the release of a mouse button. Defaults to 0.05.
+
+    Description:
+        Events are scheduled with `press_key` and `click` at times of core.getTime(),
+        and injected by a background thread, so the response loop of the main thread runs as in a session.
+        The time of each injection is stored in `injected`, in the order of the events.
+    '''
+
+    def __init__(self, win, backend:str = "emulated", hold:float = 0.05):
+
+        if backend not in ["emulated", "xdotool"]:
+            raise ValueError("The backend should be emulated or xdotool")
+        if backend == "xdotool" and shutil.which("xdotool") is None:
+            raise RuntimeError("xdotool is not installed")
+
+        self.win = win
+        self.backend = backend
+        self.hold = hold
+        self.events = []
+        self.injected = []
+        self.thread = None
+
+    def press_key(self, key:str, at:float):
+        '''Schedule a key press
+
+        Args:
+            key (str): The psychopy name of the key, e.g., "f" or "return".
+            at (float): The time of the press, from core.getTime().
+        '''
+        self.events.append((at, "key", key))
+
+    def click(self, pos, at:float):
+        '''Schedule a click of the left mouse button
+
+        Args:
+            pos (list | callable): The position in height units, or a function that returns it at the time of the click
+                (e.g., for buttons that are created by the trial).
+            at (float): The time of the press, from core.getTime().
+        '''
+        self.events.append((at, "click", pos))
+
+    def start(self):
+        '''Start injecting the scheduled events'''
+
+        self.events.sort(key=lambda e: e[0])
+        self.injected = []
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def join(self):
+        '''Wait until all events are injected'''
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.events = []
+
+    def __run(self):
+
+        for at, kind, value in self.events:
+            # sleep until just before the event, then spin to the exact time
+            while at - core.getTime() > 0.002:
+                time.sleep(0.001)
+            while core.getTime() < at:
+                pass
+
+            if kind == "key":
+                self.injected.append(core.getTime())
+                self.__key(value)
+            else:
+                self.__click(value() if callable(value) else value)
+
+    def __key(self, key):
+
+        if self.backend == "emulated":
+            event._onPygletKey(key, 0, emulated=True)
+        else:
+            subprocess.Popen(["xdotool", "key", _xdotool_keys.get(key, key)])
+
+    def __click(self, pos):
+
+        # the position in pixels from the bottom left corner of the window
+        x, y = (np.asarray(pos, dtype=float)*self.win.size[1] + np.array(self.win.size)/2).astype(int)
+
+        if self.backend == "emulated":
+            self.win.winHandle._mouse_x = x
+            self.win.winHandle._mouse_y = y
+            self.injected.append(core.getTime())
+            event._onPygletMousePress(x, y, event.LEFT, 0, emulated=True)
+            time.sleep(self.hold)
+            event._onPygletMouseRelease(x, y, event.LEFT, 0, emulated=True)
+        else:
+            window = str(self.win.winHandle._window)
+            subprocess.run(["xdotool", "mousemove", "--window", window, str(x), str(self.win.size[1] - y)])
+            self.injected.append(core.getTime())
+            subprocess.Popen(["xdotool", "click", "1"])
+
+
+def latency_summary(errors):
+    '''Summarize a distribution of RT errors
+
+    Args:
+        errors (array): The errors in seconds (reported RT minus true RT).
+
+    Returns:
+        dict: the number of samples and the mean, SD, min, median, 95th percentile and max in ms
+    '''
+
+    errors = np.asarray(errors, dtype=float)*1000
+    errors = errors[~np.isnan(errors)]
+    if len(errors) == 0:
+        return {"n": 0}
+    return {
+        "n": len(errors),
+        "mean": errors.mean(),
+        "sd": errors.std(ddof=1) if len(errors) > 1 else 0.0,
+        "min": errors.min(),
+        "median": np.median(errors),
+        "p95": np.percentile(errors, 95),
+        "max": errors.max(),
+    }
+
+
+def measure_trial(win, make_trial, n:int = 50, delays = (0.2, 0.6), backend:str = "emulated", seed = None):
+    '''Measure the RT error of trials
+
+    Args:
+        win (object): the window object from psychopy
+        make_trial (callable): A function that returns a new trial object. Key trials are answered with their first choice,
+            and button trials with a click on their first button.
+        n (int, optional): The number of trials. Defaults to 50.
+        delays (tuple, optional): The range of the true RTs after the response is allowed, in seconds. Defaults to (0.2, 0.6).
+        backend (str, optional): The backend of the virtual input. Defaults to "emulated".
+        seed (int, optional): The random seed of the true RTs. Defaults to None.
+
+    Returns:
+        numpy.ndarray: the RT error of each trial in seconds (NaN if the trial missed the response)
+    '''
+
+    rng = np.random.default_rng(seed)
+    device = virtualInput(win, backend)
+    errors = np.full(n, np.nan)
+
+    for i in range(n):
+        t = make_trial()
+        if t.resp_type not in ["key", "button"]:
+            raise ValueError("The trials should have key or button responses")
+
+        at = core.getTime() + t.resp_start + rng.uniform(*delays)
+        if t.resp_type == "key":
+            device.press_key(t.choices[0], at)
+        else:
+            device.click(lambda: t.buttons.geometry()[1][0], at)
+
+        event.clearEvents()
+        device.start()
+        t.run()
+        device.join()
+
+        if t.rt is not None:
+            errors[i] = t.rt - (device.injected[0] - t.onset)
+
+    return errors
+
+
+def measure_instr_brief(win, n:int = 50, resp_type:str = "key", key:str = "space", delays = (0.2, 0.6), resp_start:float = 0.2, backend:str = "emulated", seed = None):
+    '''Measure the RT error of brief instructions
+
+    Args:
+        win (object): the window object from psychopy
+        n (int, optional): The number of instructions. Defaults to 50.
+        resp_type (str, optional): "key" or "mouse". Defaults to "key".
+        key (str, optional): The key that ends the instruction. Defaults to "space".
+        delays (tuple, optional): The range of the true RTs after the response is allowed, in seconds. Defaults to (0.2, 0.6).
+        resp_start (float, optional): The lockout of the instructions. Defaults to 0.2.
+        backend (str, optional): The backend of the virtual input. Defaults to "emulated".
+        seed (int, optional): The random seed of the true RTs. Defaults to None.
+
+    Returns:
+        numpy.ndarray: the RT error of each instruction in seconds (NaN if the instruction missed the response)
+    '''
+
+    if resp_type not in ["key", "mouse"]:
+        raise ValueError("The response type should be key or mouse")
+
+    rng = np.random.default_rng(seed)
+    device = virtualInput(win, backend)
+    errors = np.full(n, np.nan)
+    timeout = resp_start + delays[1] + 1
+
+    for i in range(n):
+        at = core.getTime() + resp_start + rng.uniform(*delays)
+        if resp_type == "key":
+            device.press_key(key, at)
+        else:
+            device.click([0, 0], at)
+
+        event.clearEvents()
+        device.start()
+        instr = instr_brief(win, f"Latency test {i+1}/{n}", resp_type=resp_type, choice=key, resp_start=resp_start, duration=timeout)
+        device.join()
+
+        if instr.rt is not None and instr.rt < timeout:
+            errors[i] = instr.rt - (device.injected[0] - instr.start_time)
+
+    return errors
+
+
+def measure_instr_input(win, n:int = 50, text:str = "ab", delays = (0.2, 0.6), backend:str = "emulated", seed = None):
+    '''Measure the latency of input screens
+
+    Args:
+        win (object): the window object from psychopy
+        n (int, optional): The number of screens. Defaults to 50.
+        text (str, optional): The text that is typed before the return key. Defaults to "ab".
+        delays (tuple, optional): The range of the times of the return key, in seconds. Defaults to (0.2, 0.6).
+        backend (str, optional): The backend of the virtual input. Defaults to "emulated".
+        seed (int, optional): The random seed of the times. Defaults to None.
+
+    Returns:
+        numpy.ndarray: the time between the return key and the end of instr_input in seconds
+            (NaN if the screen missed the response or the text)
+    '''
+
+    rng = np.random.default_rng(seed)
+    device = virtualInput(win, backend)
+    errors = np.full(n, np.nan)
+
+    for i in range(n):
+        start = core.getTime()
+        at = start + rng.uniform(*delays)
+        for j, key in enumerate(text):
+            device.press_key(key, start + (j + 1)*(at - start)/(len(text) + 1))
+        device.press_key("return", at)
+
+        event.clearEvents()
+        device.start()
+        result = instr_input(win, f"Latency test {i+1}/{n}", choice="return", duration=delays[1] + 1)
+        end = core.getTime()
+        device.join()
+
+        if result == text.upper():
+            errors[i] = end - device.injected[-1]
+
+    return errors
+
+
+def run_latency_suite(win, n:int = 50, backend:str = "emulated", seed = None):
+    '''Measure the RT error of key and button trials, brief instructions, and input screens
+
+    Args:
+        win (object): the window object from psychopy
+        n (int, optional): The number of repetitions of each test. Defaults to 50.
+        backend (str, optional): The backend of the virtual input. Defaults to "emulated".
+        seed (int, optional): The random seed. Defaults to None.
+
+    Returns:
+        dict: the summary of the errors of each test (see `latency_summary`)
+    '''
+
+    seeds = np.random.SeedSequence(seed).spawn(5)
+    text = visual.TextStim(win, text="+", color=[-1,-1,-1])
+    buttons = stimBoxes(win, setsize=2, layout="line", center=[0, -0.4], width=0.2, height=0.08)
+    buttons.stim_text(text=["left", "right"], height=0.06, color=[-1,-1,-1])
+
+    tests = {
+        "trial.key": lambda: measure_trial(win, lambda: trial(win, [text], "key", ["f", "j"], duration=2), n, backend=backend, seed=seeds[0]),
+        "trial.button": lambda: measure_trial(win, lambda: trial(win, [text], "button", buttons, duration=2), n, backend=backend, seed=seeds[1]),
+        "instr_brief.key": lambda: measure_instr_brief(win, n, "key", backend=backend, seed=seeds[2]),
+        "instr_brief.mouse": lambda: measure_instr_brief(win, n, "mouse", backend=backend, seed=seeds[3]),
+        "instr_input": lambda: measure_instr_input(win, n, backend=backend, seed=seeds[4]),
+    }
+    return {name: latency_summary(test()) for name, test in tests.items()}
+
+
+def main(argv = None):
+    '''Run the latency suite in a new window and print the errors'''
+
+    parser = argparse.ArgumentParser(description="Measure the response latency of cogpy")
+    parser.add_argument("-n", type=int, default=50, help="the number of repetitions of each test")
+    parser.add_argument("--backend", default="emulated", choices=["emulated", "xdotool"], help="the source of the input events")
+    parser.add_argument("--seed", type=int, default=None, help="the random seed of the true RTs")
+    args = parser.parse_args(argv)
+
+    win = visual.Window(size=[1600,900], color=[1,1,1], fullscr=False)
+    try:
+        report = run_latency_suite(win, args.n, args.backend, args.seed)
+    finally:
+        win.close()
+
+    print(f"{'test':<20}{'n':>5}{'mean':>9}{'sd':>9}{'median':>9}{'p95':>9}{'max':>9}  (ms)")
+    for name, s in report.items():
+        if s["n"] == 0:
+            print(f"{name:<20}{0:>5}")
+            continue
+        print(f"{name:<20}{s['n']:>5}{s['mean']:>9.2f}{s['sd']:>9.2f}{s['median']:>9.2f}{s['p95']:>9.2f}{s['max']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,11 @@ from psychopy.visual import TextStim, ImageStim, Rect
 import random
 import numpy as np
 import warnings
+from .image import load_image, is_image_array, as_texture
+from .texture import cache as texture_cache
+from .motion import bounce_walls, collide
+from .geometry import check_boxes
+from .profiling import profiled
 
 
 class stimBoxes(object):
@@ -36,12 +41,12 @@ class stimBoxes(object):
             - spacing (list, optional): The spacing between boxes in the grid. Defaults to [0, 0].
         
         - Random layout:
-            - width (float, optional): The width of the area. Defaults to the window height.
-            - height (float, optional): The height of the area. Defaults to the window height.
+            - area (list, optional): The width and height of the area. Defaults to the window height for both.
             - spacing (float, optional): The spacing between boxes. Defaults to 0.
         
         - Custom layout:
             - positions (dict): A dictionary of positions for each box. The keys are the names of the boxes, and the values are the positions of the boxes. (Required)
+            - check (bool, optional): Whether to raise an error if boxes overlap or are outside the window. Defaults to True.
         
         Common box arguments:
             - width (float, optional): The width of each box. Defaults to 0.16.
@@ -51,12 +56,13 @@ class stimBoxes(object):
             - units (str, optional): The units for the box dimensions. Must be "height".
     '''
     
+    @profiled("stimBoxes.__init__")
     def __init__(self, win, setsize, layout = "line", **args):
         self.win = win
         self.setsize = setsize
         self.box_args = args
         self.winH = 1 # window height
-        self.winW = win.windowedSize[0]/win.windowedSize[1]*self.winH # window width
+        self.winW = _window_width(win)*self.winH # window width
         
         # set up default arguments
         self.box_args["width"] = self.box_args.get("width", 0.16)
@@ -70,255 +76,19 @@ class stimBoxes(object):
         self.box_args["units"] = "height"
         
         # set up default arguments according to the layout
-        layout_args = {}
-        layout_args["center"] = args.pop("center", [0, 0])
-
-        
-        if layout == "circle":
-            # set up default arguments
-            layout_args["radius"] = args.pop("radius", 0.3)
-            layout_args["oval"] = args.pop("oval", 1)
-            layout_args["rotation"] = args.pop("rotation", 0)
-            # arrange the boxes in a circle
-            self.__arrange_circle(**layout_args)
-            
-        elif layout == "line":
-            # set up default arguments
-            layout_args["direction"] = args.pop("direction", "horizontal")
-            layout_args["spacing"] = args.pop("spacing", 0)
-            # arrange the boxes in a line
-            self.__arrange_line(**layout_args)
-            
-        elif layout == "grid":
-            # set up default arguments
-            if "nrow" not in args or "ncol" not in args:
-                raise ValueError("The number of rows and columns should be specified for the grid layout")
-            else:
-                layout_args["nrow"] = args.pop("nrow")
-                layout_args["ncol"] = args.pop("ncol")
-            layout_args["spacing"] = args.pop("spacing", [0,0])
-            # arrange the boxes in a grid
-            self.__arrange_grid(**layout_args)
-            
-        elif layout == "random":
-            # set up default arguments
-            layout_args["width"] = args.pop("width", self.winH)
-            layout_args["height"] = args.pop("height", self.winH)
-            layout_args["spacing"] = args.pop("spacing", 0)
-            # arrange the boxes randomly
-            self.__arrange_random(**layout_args)
-            
-        elif layout == "custom":
-            # set up default arguments
-            if "positions" not in args:
-                raise ValueError("The positions should be specified for the custom layout")
-            else:
-                layout_args["positions"] = args.pop("positions")
-            # arrange the boxes based on custom positions
-            self.__arrange_custom(**layout_args)
-        else:
-            raise ValueError("The layout should be either circle, line, grid, random, or custom")
-
-
-            
-    def __arrange_circle(self, center = [0,0], radius=0.3, oval=1, rotation=0):
-        '''Arrange the boxes in a circle
-
-        Args:
-            radius (float, optional): The radius of the circle. Defaults to 0.5.
-            center (list, optional): The center of the circle. Defaults to [0,0].
-            oval (int, optional): The ovalness of the circle. 
-                A value larger than 1 will make the circle taller, 
-                while a value smaller than 1 will make the circle wider. 
-                The default value is 1.
-            rotation (int, optional): The rotation of the circle.
-                A positive value will rotate the circle clockwise,
-                while a negative value will rotate the circle counterclockwise.
-                The default value is 0.
-        '''
+        self.layout = layout
+        self.layout_args = _layout_args(layout, args)
         
-        # check the input values
-        if (radius < 0 or radius > 0.5):
-            raise ValueError("The radius should be between 0 and 0.5")
-        if (oval < 0):
-            raise ValueError("The ovalness should be larger than 0")
-        if (radius*oval > self.winH/2):
-            raise ValueError("The ovalness is too large")
+        # arrange the boxes
+        positions = _arrange(
+            layout, setsize, self.box_args["width"], self.box_args["height"], 
+            self.winW, self.winH, self.layout_args)
         
-        # initialize the boxes
         self.boxes = {}
-        
-        n = self.setsize # number of boxes
-        rot = rotation/180*np.pi # rotation in radian
-        theta = 2*np.pi/n # angle between boxes
-        for i in range(self.setsize):
-            # calculate the position of the box
-            x = radius*np.cos(-theta*i + rot) + center[0]
-            y = radius*np.sin(-theta*i + rot)*oval + center[1]
-            # set the position of the box
-            self.boxes[f"P{i+1}"] = Rect(self.win, pos = [x, y], **self.box_args)
-    
-    def __arrange_line(self, center=[0,0], direction="horizontal", spacing:float=0):
-        '''Arrange the boxes in a line
+        for box, pos in positions.items():
+            self.boxes[box] = Rect(self.win, pos = pos, **self.box_args)
 
-        Args:
-            direction (str, optional): The direction of the line. 
-                The default value is "horizontal".
-            center (list, optional): The center of the line. Defaults to [0,0].
-            spacing (float, optional): The spacing between boxes. Defaults to 0.
-        '''
-        n = self.setsize # number of boxes
-        width = self.box_args["width"]
-        height = self.box_args["height"]
-        
-        # initialize the boxes
-        self.boxes = {}
-        
-        if direction == "horizontal":
-            # check if the boxes are too wide
-            if width*n + spacing*(n-1) > 2:
-                raise ValueError("The boxes are too wide to fit in the window")
-                
-            # calculate the total width of the line and the leftmost x position
-            lineW = width*n + spacing*(n-1)
-            leftX = center[0] - lineW/2
-        
-            for i in range(n):
-                x = leftX + (i + 0.5)*width + i*spacing
-                self.boxes[f"P{i+1}"] = Rect(self.win, pos = [x, center[1]], **self.box_args)
-                
-        elif direction == "vertical":
-            
-            # check if the boxes are too tall
-            if height*n + spacing*(n-1) > 2:
-                raise ValueError("The boxes are too tall to fit in the window")
-                
-            # calculate the total height of the line and the bottommost y position
-            lineH = height*n + spacing*(n-1)
-            topY = center[1] + lineH/2
-
-            for i in range(n):
-                y = topY - (i + 0.5)*height - i*spacing
-                self.boxes[f"P{i+1}"] = Rect(self.win, pos = [center[0], y], **self.box_args)
-    
-    def __arrange_grid(self, nrow:int, ncol:int, center=[0,0], spacing = [0,0]):
-        '''Arrange the boxes in a grid
-
-        Args:
-            nrow (int): The number of rows in the grid.
-            ncol (int): The number of columns in the grid.
-            center (list, optional): The center of the grid. Defaults to [0,0].
-            spacing (list, optional): The spacing between boxes in the grid. Defaults to [0,0].
-        '''
-        n = self.setsize # number of boxes
-        width = self.box_args["width"]
-        height = self.box_args["height"]
-        
-        # check if the grid is too small or too large
-        if nrow*ncol < n:
-            raise ValueError("The grid is too small to fit all the boxes")
-        elif nrow*ncol > n:
-            warnings.warn("There are empty spaces in the grid")
-            
-        # check if the boxes are too wide or too tall
-        if width*ncol + spacing[0]*(ncol-1) > self.winW*0.9:
-            raise ValueError("The boxes are too wide to fit in the window")
-
-        if height*nrow + spacing[1]*(nrow-1) > self.winH*0.9:
-            raise ValueError("The boxes are too tall to fit in the window")
-
-            
-        # Calculate the total width and height of the grid
-        gridW = ncol * width + (ncol - 1) * spacing[0]
-        gridH = nrow * height + (nrow - 1) * spacing[1]
-
-        # Calculate offsets to center the grid at `center`
-        leftX = center[0] - gridW / 2
-        topY = center[1] + gridH / 2
-
-        # Initialize the boxes
-        self.boxes = {}
-
-        for i in range(n):
-            row = i // ncol
-            col = i % ncol
-            x = leftX + (col + 0.5) * width + col * spacing[0]
-            y = topY - (row + 0.5) * height - row * spacing[1]
-            self.boxes[f"P{i+1}"] = Rect(self.win, pos=[x, y], **self.box_args)
-    
-    def __arrange_random(self, width:float, height:float, spacing:float=0):
-        '''Randomly arrange the boxes
-
-        Args:
-            width (float): The width of the area.
-            height (float): The height of the area.
-        '''
-        
-        # number of boxes
-        n = self.setsize
-        
-        # the size of a cell
-        cellWidth = self.box_args["width"] + spacing
-        cellHeight = self.box_args["height"] + spacing
-        
-        # number of cells in the area
-        nrow = int(height/cellHeight)
-        ncol = int(width/cellWidth)
-        
-        # the width and height of the area
-        areaW = ncol*cellWidth
-        areaH = nrow*cellHeight
-        
-        # calculate the left and top position of the area
-        leftX = -areaW/2
-        topY = areaH/2
-        
-        # check if the area is too small
-        if nrow*ncol < n:
-            raise ValueError("The area is too small to fit all the boxes")
-        
-        # Generate all possible cell indices
-        cells = [(i, j) for i in range(nrow) for j in range(ncol)]
-        
-        # Shuffle the list of cells to randomize the placement
-        random.shuffle(cells)
-        
-        # Select the first n cells for placement
-        selected_cells = cells[:n]
-        
-        # Initialize the boxes
-        self.boxes = {}
-        
-        # Convert cell indices to actual positions
-        for i in range(n):
-            row = selected_cells[i][0]
-            col = selected_cells[i][1]
-            x = leftX + (col + 0.5)*cellWidth
-            y = topY - (row + 0.5)*cellHeight
-            self.boxes[f"P{i+1}"] = Rect(self.win, pos = [x, y], **self.box_args)
-    
-    def __arrange_custom(self, positions:dict):
-        '''Arrange the boxes based on custom positions
-
-        Args:
-            positions (dict): A dictionary of positions for each box.
-                The keys are the names of the boxes, and the values are the positions of the boxes.
-        '''
-        
-        # number of boxes
-        n = self.setsize
-        
-        # check if the number of positions matches the number of boxes
-        if len(positions) != n:
-            raise ValueError("The number of positions should match the number of boxes")
-        
-        # initialize the boxes
-        self.boxes = {}
-        
-        # add the boxes to the layout
-        for i in range(n):
-            self.boxes[f"P{i+1}"] = Rect(self.win, positions[f"P{i+1}"], **self.box_args)
-    
+    @profiled("stimBoxes.stim_text")
     def stim_text(self, text:list|dict, **args):
         '''Add text stimuli to the boxes
 
@@ -341,6 +111,7 @@ class stimBoxes(object):
         
         # initialize the text stimuli
         self.text = {}
+        self.text_args = args
         
         if isinstance(text, list):
             # check if the number of text stimuli matches the number of boxes
@@ -354,14 +125,25 @@ class stimBoxes(object):
             for box,content in text.items():
                 self.text[box] = TextStim(self.win, text=content, pos=self.boxes[box].pos, **args)
     
-    def stim_image(self, image:list|dict, scale = 1, **args):
+    @profiled("stimBoxes.stim_image")
+    def stim_image(self, image:list|dict, scale = 1, draft = True, cache_dir = None, atlas = None, bank = False, **args):
         '''Add image stimuli to the boxes
 
         Args:
-            image (list|dict): The image stimuli to be added to the boxes.
+            image (list|dict|array): The image stimuli to be added to the boxes.
                 If a list is provided, the images will be added to the boxes in order.
                 If a dictionary is provided, the images will be added to the boxes based on the keys.
+                Each image is a path, or an array (e.g., a NumPy array, an image of a memory-mapped bank from `cogpy.image.open_bank`,
+                or an object with the buffer protocol) that is passed to the texture without a file (see `cogpy.image.as_texture`).
+                An array with one image per box (e.g., `bank[:6]`) is also accepted: a 4-D array of color images,
+                or a 3-D array of grayscale images with `bank=True`.
             scale (float, optional): The scaling factor for the images. Defaults to 1.
+            draft (bool, optional): Whether to use the Pillow draft mode when decoding the images. Defaults to True.
+            cache_dir (str, optional): The folder for the pyramid cache of the decoded images. Defaults to None.
+            atlas (imageAtlas, optional): An image atlas. If provided, the images are atlas keys,
+                and all images are composed into a single panel that is drawn as one texture. Defaults to None.
+            bank (bool, optional): Whether a 3-D array is a stack of grayscale images (one per box) rather than a single color image. 
+                Defaults to False.
         ''' 
         
         if args.get("units", "height") != "height":
@@ -375,30 +157,166 @@ class stimBoxes(object):
         
         # initialize the image stimuli
         self.images = {}
+        self.image_names = {}
+        self.image_sources = {}
+        self.image_args = args
+        self.panel = None
+        
+        if isinstance(image, np.ndarray):
+            # one image per box, as views of the array
+            if image.ndim == 4 or (image.ndim == 3 and bank):
+                image = list(image)
+            else:
+                raise ValueError("A single image array should be given in a list or a dict; "
+                                 "a stack of images should be a 4-D array, or a 3-D array with bank=True")
         
         if isinstance(image, list):
             # check if the number of image stimuli matches the number of boxes
             if len(image) != len(self.boxes):
                 raise ValueError("The number of image stimuli should match the number of boxes")
-            # add images to the boxes
-            for i, box in enumerate(self.boxes):
-                # create the image object
-                self.images[box] = ImageStim(self.win, image=str(image[i]), pos=self.boxes[box].pos, **args)
-                # resize the image
-                ratioW = self.images[box].size[0]/self.box_args["width"]
-                ratioH = self.images[box].size[1]/self.box_args["height"]
-                ratio = np.max([ratioW, ratioH])
-                self.images[box].size = self.images[box].size/ratio * scale
-                    
-        elif isinstance(image, dict):
+            image = dict(zip(self.boxes, image))
+        elif not isinstance(image, dict):
+            raise ValueError("The image stimuli should be a list or a dictionary")
+        
+        if atlas is not None:
+            # compose the images into a single panel
+            self.__add_panel(image, atlas, scale, args)
+        else:
             # add images to the boxes
             for box, content in image.items():
-                self.images[box] = ImageStim(self.win, image=str(content), pos=self.boxes[box].pos, **args)
-                # resize the image
-                ratioW = self.images[box].size[0]/self.box_args["width"]
-                ratioH = self.images[box].size[1]/self.box_args["height"]
-                ratio = np.max([ratioW, ratioH])
-                self.images[box].size = self.images[box].size/ratio * scale
+                self.__add_image(box, content, scale, draft, cache_dir, args)
+    
+    def __add_image(self, box, content, scale, draft, cache_dir, args):
+        '''Decode an image at the pixel size of the box and add it to the box
+
+        Args:
+            box (str): The name of the box.
+            content (str): The path of the image.
+            scale (float): The scaling factor for the image.
+            draft (bool): Whether to use the Pillow draft mode.
+            cache_dir (str): The folder for the pyramid cache.
+        '''
+        
+        if is_image_array(content):
+            self.__add_array(box, content, scale, args)
+            return
+        
+        # create the image object
+        self.images[box] = ImageStim(self.win, image=self.__decode(content, scale, draft, cache_dir), pos=self.boxes[box].pos, **args)
+        self.image_names[box] = str(content)
+        self.image_sources[box] = (str(content), scale, draft, cache_dir)
+        # resize the image
+        ratioW = self.images[box].size[0]/self.box_args["width"]
+        ratioH = self.images[box].size[1]/self.box_args["height"]
+        ratio = np.max([ratioW, ratioH])
+        self.images[box].size = self.images[box].size/ratio * scale
+    
+    def __add_array(self, box, content, scale, args):
+        '''Add an image array to the box, without an intermediate file
+
+        Args:
+            box (str): The name of the box.
+            content (array): The image array.
+            scale (float): The scaling factor for the image.
+        '''
+        
+        texture = as_texture(content)
+        
+        # fit the image in the box
+        h, w = texture.shape[:2]
+        ratio = max(w/self.box_args["width"], h/self.box_args["height"])
+        size = [w/ratio*scale, h/ratio*scale]
+        
+        self.images[box] = ImageStim(self.win, **{**args, "image": texture, "pos": self.boxes[box].pos, "size": size})
+        self.image_names[box] = box
+    
+    def __decode(self, content, scale, draft, cache_dir):
+        '''Decode an image at the pixel size of the boxes in the window'''
+        
+        winPix = self.win.size[1] # window height in pixels
+        target = [self.box_args["width"]*scale*winPix, self.box_args["height"]*scale*winPix]
+        return load_image(str(content), target, draft=draft, cache_dir=cache_dir)
+    
+    def __add_panel(self, image:dict, atlas, scale, args):
+        '''Compose atlas images into a single panel covering the boxes
+
+        Args:
+            image (dict): The atlas keys of the images. The keys are the names of the boxes.
+            atlas (imageAtlas): The image atlas.
+            scale (float): The scaling factor for the images.
+        '''
+        
+        winPix = self.win.size[1] # window height in pixels
+        boxW = self.box_args["width"]*scale
+        boxH = self.box_args["height"]*scale
+        
+        # the area covered by the boxes, in height units
+        xs = [self.boxes[box].pos[0] for box in image]
+        ys = [self.boxes[box].pos[1] for box in image]
+        left, right = min(xs) - boxW/2, max(xs) + boxW/2
+        bottom, top = min(ys) - boxH/2, max(ys) + boxH/2
+        
+        # the images at the positions of the boxes, composed once per image set
+        placements = []
+        for box, key in image.items():
+            x = round((self.boxes[box].pos[0] - left)*winPix)
+            y = round((top - self.boxes[box].pos[1])*winPix)
+            placements.append((key, x, y))
+            self.image_names[box] = key
+        size = (int(np.ceil((right - left)*winPix)), int(np.ceil((top - bottom)*winPix)))
+        texture = atlas.compose(placements, size, (boxW*winPix, boxH*winPix))
+        
+        # create the panel object
+        self.panel = ImageStim(
+            self.win, image=texture, 
+            pos=[(left + right)/2, (bottom + top)/2], 
+            size=[right - left, top - bottom], **args)
+    
+    @profiled("stimBoxes.stim_texture")
+    def stim_texture(self, kind:str, params:dict = None, scale = 1, res = None, workers = None, **args):
+        '''Add procedural textures to the boxes
+
+        Args:
+            kind (str): The type of texture. One of "gabor", "square", "bar", or "noise".
+            params (dict, optional): The parameters of the textures (see `cogpy.texture`).
+                Each parameter is either a single value or a list with one value per box,
+                e.g. `stim_texture("gabor", {"ori": [0, 45, 90, 135], "sf": 4})`. Defaults to None (the default parameters).
+            scale (float, optional): The scaling factor for the textures. Defaults to 1.
+            res (int, optional): The resolution of the textures in pixels.
+                Defaults to the pixel size of the boxes, rounded up to a power of two.
+            workers (int, optional): The number of worker processes for noise masks. Defaults to None.
+        
+        Description:
+            The textures of all boxes are generated in one vectorized batch,
+            and textures with the same parameters are reused from the cache.
+        '''
+        
+        if args.get("units", "height") != "height":
+            raise ValueError("This class only supports height units")
+        else:
+            args["units"] = "height"
+            
+        # check if the boxes are not initialized
+        if not hasattr(self, "boxes"):
+            raise ValueError("The boxes are not initialized")
+        
+        # the textures are square and fit in the boxes
+        size = min(self.box_args["width"], self.box_args["height"])*scale
+        if res is None:
+            res = int(2**np.ceil(np.log2(max(2, size*self.win.size[1]))))
+        
+        textures = texture_cache.generate(kind, res, self.setsize, workers=workers, **(params or {}))
+        
+        # initialize the image stimuli
+        self.images = {}
+        self.image_names = {}
+        self.image_sources = {}
+        self.image_args = args
+        self.panel = None
+        
+        for (image, mask), box in zip(textures, self.boxes):
+            self.images[box] = ImageStim(self.win, image=image, mask=mask, pos=self.boxes[box].pos, size=[size, size], **args)
+            self.image_names[box] = kind
     
     def stim_boxes(self, **args):
         '''Assign different properties to the boxes
@@ -422,7 +340,268 @@ class stimBoxes(object):
         for arg in args:
             for i in range(self.setsize):
                 self.boxes[f"P{i+1}"].__setattr__(arg, args[arg][i])
+        
+        # keep the properties for copy_to
+        self.box_props = {**getattr(self, "box_props", {}), **args}
+
+    
+    def geometry(self):
+        '''Get the geometry of the boxes as arrays
+
+        Returns:
+            tuple: the names of the boxes, the centers (one row of [x, y] per box), 
+                and the sizes (one row of [width, height] per box) in height units
+        '''
+        
+        # check if the boxes are not initialized
+        if not hasattr(self, "boxes"):
+            raise ValueError("The boxes are not initialized")
+        
+        names = list(self.boxes)
+        centers = np.array([self.boxes[box].pos for box in names], dtype=float)
+        sizes = np.array([[self.boxes[box].width, self.boxes[box].height] for box in names], dtype=float)
+        
+        return names, centers, sizes
+    
+    def validate(self, margin:float = 0):
+        '''Check the boxes for overlaps and boxes outside the window
 
+        Args:
+            margin (float, optional): The minimum gap between two boxes. Defaults to 0 (boxes may touch).
+
+        Returns:
+            dict: the overlapping pairs of box names ("overlaps") and the names of the boxes outside the window ("off_screen")
+        '''
+        
+        names, centers, sizes = self.geometry()
+        return check_boxes(names, centers, sizes, [-self.winW/2, -self.winH/2, self.winW/2, self.winH/2], margin)
+    
+    def set_motion(self, velocity = None, trajectory = None, bounds = None, collision = False):
+        '''Set up the motion of the boxes for `step`
+
+        Args:
+            velocity (list, optional): The velocity of each box in height units per second, 
+                one [vx, vy] per box. Defaults to None.
+            trajectory (callable, optional): A function that takes the time since the start of the motion 
+                and the start positions (one row of [x, y] per box) and returns the positions, 
+                e.g. `cogpy.motion.rotating(speed=30)`. Defaults to None.
+            bounds (list, optional): The area in which the boxes bounce off the walls, 
+                as [left, bottom, right, top]. Only used with velocities. Defaults to the window.
+            collision (bool, optional): Whether the boxes bounce off each other. 
+                Only used with velocities. Defaults to False.
+        
+        Description:
+            Either a velocity or a trajectory should be provided. The text and image stimuli 
+            are moved with the boxes, so they should be added before the motion is set up.
+        '''
+        
+        # check if the boxes are not initialized
+        if not hasattr(self, "boxes"):
+            raise ValueError("The boxes are not initialized")
+        if (velocity is None) == (trajectory is None):
+            raise ValueError("Either a velocity or a trajectory should be provided")
+        if getattr(self, "panel", None) is not None:
+            raise ValueError("Images composed from an atlas cannot move with the boxes")
+        
+        names, self.positions, self.sizes = self.geometry()
+        self.start_positions = self.positions.copy()
+        self.trajectory = trajectory
+        self.motion_time = 0
+        self.collision = collision
+        
+        if velocity is not None:
+            self.velocities = np.array(velocity, dtype=float).reshape(self.setsize, 2)
+        else:
+            self.velocities = None
+        
+        self.motion_bounds = bounds
+        if bounds is None:
+            bounds = [-self.winW/2, -self.winH/2, self.winW/2, self.winH/2]
+        self.bounds = np.array(bounds, dtype=float)
+        
+        # the stimuli that move with each box
+        self.attached = []
+        for i, box in enumerate(names):
+            self.attached.append((self.boxes[box], i))
+            if hasattr(self, "text") and box in self.text:
+                self.attached.append((self.text[box], i))
+            if hasattr(self, "images") and box in self.images:
+                self.attached.append((self.images[box], i))
+    
+    @profiled("stimBoxes.step")
+    def step(self, dt:float):
+        '''Move the boxes and their stimuli by one time step
+
+        Args:
+            dt (float): The time step in seconds, usually the frame period of the window.
+        
+        Description:
+            The positions are updated in one vectorized batch, and the new positions are then 
+            set on each box, text, and image object (which remain separate psychopy objects).
+        '''
+        
+        if not hasattr(self, "attached"):
+            raise ValueError("The motion is not set up")
+        
+        self.motion_time += dt
+        
+        if self.trajectory is not None:
+            self.positions = np.asarray(self.trajectory(self.motion_time, self.start_positions), dtype=float)
+        else:
+            self.positions += self.velocities*dt
+            if self.collision:
+                collide(self.positions, self.velocities, self.sizes)
+            bounce_walls(self.positions, self.velocities, self.sizes, self.bounds)
+        
+        # move the stimuli
+        positions = self.positions
+        for stim, i in self.attached:
+            stim.pos = positions[i]
+    
+    @profiled("stimBoxes.relayout")
+    def relayout(self, **args):
+        '''Recompute the positions of the boxes in place and move their stimuli
+
+        Args:
+            **args: The layout arguments to change (e.g., `radius` of a circle layout).
+                The other layout arguments are kept.
+        
+        Description:
+            The positions are in height units, so they only change with the layout arguments; 
+            the layout is also checked again against the width of the window, and the motion bounds follow the window.
+            A random layout keeps its positions unless its arguments change.
+        '''
+        
+        # check if the boxes are not initialized
+        if not hasattr(self, "boxes"):
+            raise ValueError("The boxes are not initialized")
+        
+        layout_args = {**self.layout_args, **args}
+        if self.layout == "random" and not args:
+            positions = {box: list(self.boxes[box].pos) for box in self.boxes}
+        else:
+            positions = _arrange(
+                self.layout, self.setsize, self.box_args["width"], self.box_args["height"], 
+                self.winW, self.winH, layout_args)
+        self.layout_args = layout_args
+        
+        moved = any(not np.allclose(self.boxes[box].pos, pos) for box, pos in positions.items())
+        if moved and getattr(self, "panel", None) is not None:
+            raise ValueError("Images composed from an atlas cannot be moved, add them again with stim_image")
+        
+        # move the boxes and their stimuli
+        for box, pos in positions.items():
+            for stim in self.__stimuli(box):
+                stim.pos = pos
+        
+        # update the motion
+        if hasattr(self, "attached"):
+            names, self.positions, self.sizes = self.geometry()
+            self.start_positions = self.positions.copy()
+            if self.motion_bounds is None:
+                self.bounds = np.array([-self.winW/2, -self.winH/2, self.winW/2, self.winH/2])
+    
+    @profiled("stimBoxes.retarget")
+    def retarget(self, win = None):
+        '''Move the boxes and their stimuli to another window, or update them after the window changed
+
+        Args:
+            win (Any, optional): The new window. Defaults to the current window 
+                (e.g., after its size changed or fullscreen was toggled).
+        
+        Description:
+            The existing box, text, and image objects are kept. Their vertices and text are updated 
+            for the pixels of the window, and images from files are decoded again if the height of the window in pixels changed.
+        '''
+        
+        win = self.win if win is None else win
+        old_pix = self.win.size[1]
+        self.win = win
+        self.winW = _window_width(win)*self.winH
+        
+        for stim in self.__stimuli():
+            stim.win = win
+            stim.pos = stim.pos
+            if isinstance(stim, TextStim):
+                stim.height = stim.height # render the text at the new pixel size
+            else:
+                stim.size = stim.size
+        
+        # decode the images at the pixel size of the new window
+        if win.size[1] != old_pix:
+            for box, (content, scale, draft, cache_dir) in getattr(self, "image_sources", {}).items():
+                size = self.images[box].size
+                self.images[box].image = self.__decode(content, scale, draft, cache_dir)
+                self.images[box].size = size
+        
+        self.relayout()
+    
+    @profiled("stimBoxes.copy_to")
+    def copy_to(self, win):
+        '''Create the same boxes and stimuli in another window
+
+        Args:
+            win (Any): The window of the copy.
+
+        Returns:
+            stimBoxes: the copy. The layout is not computed again, and the decoded images and texture arrays are reused 
+                (images from files are decoded again only if the windows differ in height in pixels). 
+                Each window has its own OpenGL context, so the copy uploads its own textures.
+        '''
+        
+        # check if the boxes are not initialized
+        if not hasattr(self, "boxes"):
+            raise ValueError("The boxes are not initialized")
+        
+        new = stimBoxes.__new__(stimBoxes)
+        new.win = win
+        new.setsize = self.setsize
+        new.box_args = dict(self.box_args)
+        new.winH = self.winH
+        new.winW = _window_width(win)*new.winH
+        new.layout = self.layout
+        new.layout_args = dict(self.layout_args)
+        
+        new.boxes = {box: Rect(win, pos=rect.pos, **new.box_args) for box, rect in self.boxes.items()}
+        if hasattr(self, "box_props"):
+            new.stim_boxes(**self.box_props)
+        
+        if hasattr(self, "text"):
+            new.text_args = dict(self.text_args)
+            new.text = {box: TextStim(win, text=stim.text, pos=stim.pos, **new.text_args) for box, stim in self.text.items()}
+        
+        if hasattr(self, "images"):
+            new.image_args = dict(self.image_args)
+            new.image_names = dict(self.image_names)
+            new.image_sources = dict(self.image_sources)
+            new.images = {}
+            for box, stim in self.images.items():
+                image = stim.image
+                if box in new.image_sources and win.size[1] != self.win.size[1]:
+                    image = new.__decode(*new.image_sources[box])
+                new.images[box] = ImageStim(win, **{**new.image_args, "image": image, "mask": stim.mask, "pos": stim.pos, "size": stim.size})
+            new.panel = None
+            if self.panel is not None:
+                new.panel = ImageStim(win, **{**new.image_args, "image": self.panel.image, "pos": self.panel.pos, "size": self.panel.size})
+        
+        # check the layout against the width of the new window
+        new.relayout()
+        
+        return new
+    
+    def __stimuli(self, box = None):
+        '''The boxes, text, and images (of one box, or all of them)'''
+        
+        stimuli = []
+        for name in self.boxes if box is None else [box]:
+            stimuli.append(self.boxes[name])
+            if hasattr(self, "text") and name in self.text:
+                stimuli.append(self.text[name])
+            if hasattr(self, "images") and name in self.images:
+                stimuli.append(self.images[name])
+        if box is None and getattr(self, "panel", None) is not None:
+            stimuli.append(self.panel)
+        return stimuli
     
     def __draw_boxes(self):
         '''Draw the boxes and text stimuli
@@ -450,7 +629,11 @@ class stimBoxes(object):
         
         for box in self.images:
             self.images[box].draw()
+        
+        if self.panel is not None:
+            self.panel.draw()
     
+    @profiled("stimBoxes.draw")
     def draw(self):
         '''Draw the boxes and stimuli
         '''
@@ -458,4 +641,303 @@ class stimBoxes(object):
         if hasattr(self, "boxes"): self.__draw_boxes()
         if hasattr(self, "images"):self.__draw_images()
         if hasattr(self, "text"): self.__draw_text()
-        
\ No newline at end of file
+        
+
+
+def _window_width(win):
+    '''The width of the window in height units'''
+    
+    return win.size[0]/win.size[1]
+
+
+def _layout_args(layout:str, args:dict):
+    '''Take the layout arguments out of the arguments and set up their default values
+
+    Args:
+        layout (str): The layout of the boxes.
+        args (dict): The arguments of the layout and the boxes. The layout arguments are removed from it.
+    '''
+    
+    layout_args = {}
+    
+    if layout == "circle":
+        layout_args["center"] = args.pop("center", [0, 0])
+        layout_args["radius"] = args.pop("radius", 0.3)
+        layout_args["oval"] = args.pop("oval", 1)
+        layout_args["rotation"] = args.pop("rotation", 0)
+        
+    elif layout == "line":
+        layout_args["center"] = args.pop("center", [0, 0])
+        layout_args["direction"] = args.pop("direction", "horizontal")
+        layout_args["spacing"] = args.pop("spacing", 0)
+        
+    elif layout == "grid":
+        if "nrow" not in args or "ncol" not in args:
+            raise ValueError("The number of rows and columns should be specified for the grid layout")
+        layout_args["center"] = args.pop("center", [0, 0])
+        layout_args["nrow"] = args.pop("nrow")
+        layout_args["ncol"] = args.pop("ncol")
+        layout_args["spacing"] = args.pop("spacing", [0,0])
+        
+    elif layout == "random":
+        layout_args["area"] = args.pop("area", None)
+        layout_args["spacing"] = args.pop("spacing", 0)
+        
+    elif layout == "custom":
+        if "positions" not in args:
+            raise ValueError("The positions should be specified for the custom layout")
+        layout_args["positions"] = args.pop("positions")
+        layout_args["check"] = args.pop("check", True)
+        
+    else:
+        raise ValueError("The layout should be either circle, line, grid, random, or custom")
+    
+    return layout_args
+
+
+def _arrange(layout:str, n:int, width:float, height:float, winW:float, winH:float, layout_args:dict):
+    '''Calculate the positions of the boxes
+
+    Returns:
+        dict: the positions of the boxes. The keys are the names of the boxes (P1, P2, ...).
+    '''
+    
+    if layout == "circle":
+        return _arrange_circle(n, winH, **layout_args)
+    elif layout == "line":
+        return _arrange_line(n, width, height, winW, winH, **layout_args)
+    elif layout == "grid":
+        return _arrange_grid(n, width, height, winW, winH, **layout_args)
+    elif layout == "random":
+        return _arrange_random(n, width, height, winH, **layout_args)
+    elif layout == "custom":
+        return _arrange_custom(n, width, height, winW, winH, **layout_args)
+    else:
+        raise ValueError("The layout should be either circle, line, grid, random, or custom")
+
+
+def layout_positions(setsize:int, layout = "line", width = 0.16, height = None, winW = 16/9, **args):
+    '''Calculate the positions of the boxes of a layout without a window
+
+    Args:
+        setsize (int): The number of boxes.
+        layout (str, optional): The layout of the boxes (see stimBoxes). Defaults to "line".
+        width (float, optional): The width of each box. Defaults to 0.16.
+        height (float, optional): The height of each box. Defaults to the width.
+        winW (float, optional): The width of the window in height units. Defaults to 16/9.
+        **args: The layout-specific arguments (see stimBoxes). Other arguments are ignored.
+
+    Returns:
+        dict: the positions of the boxes. The keys are the names of the boxes (P1, P2, ...).
+    '''
+    
+    height = width if height is None else height
+    layout_args = _layout_args(layout, dict(args))
+    return _arrange(layout, setsize, width, height, winW, 1, layout_args)
+
+
+def _arrange_circle(n, winH, center = [0,0], radius=0.3, oval=1, rotation=0):
+    '''Arrange the boxes in a circle
+
+    Args:
+        radius (float, optional): The radius of the circle. Defaults to 0.5.
+        center (list, optional): The center of the circle. Defaults to [0,0].
+        oval (int, optional): The ovalness of the circle. 
+            A value larger than 1 will make the circle taller, 
+            while a value smaller than 1 will make the circle wider. 
+            The default value is 1.
+        rotation (int, optional): The rotation of the circle.
+            A positive value will rotate the circle clockwise,
+            while a negative value will rotate the circle counterclockwise.
+            The default value is 0.
+    '''
+    
+    # check the input values
+    if (radius < 0 or radius > 0.5):
+        raise ValueError("The radius should be between 0 and 0.5")
+    if (oval < 0):
+        raise ValueError("The ovalness should be larger than 0")
+    if (radius*oval > winH/2):
+        raise ValueError("The ovalness is too large")
+    
+    # initialize the positions
+    positions = {}
+    
+    rot = rotation/180*np.pi # rotation in radian
+    theta = 2*np.pi/n # angle between boxes
+    for i in range(n):
+        # calculate the position of the box
+        x = radius*np.cos(-theta*i + rot) + center[0]
+        y = radius*np.sin(-theta*i + rot)*oval + center[1]
+        positions[f"P{i+1}"] = [x, y]
+    
+    return positions
+
+
+def _arrange_line(n, width, height, winW, winH, center=[0,0], direction="horizontal", spacing:float=0):
+    '''Arrange the boxes in a line
+
+    Args:
+        direction (str, optional): The direction of the line. 
+            The default value is "horizontal".
+        center (list, optional): The center of the line. Defaults to [0,0].
+        spacing (float, optional): The spacing between boxes. Defaults to 0.
+    '''
+    
+    # initialize the positions
+    positions = {}
+    
+    if direction == "horizontal":
+        # check if the boxes are too wide
+        if width*n + spacing*(n-1) > winW:
+            raise ValueError("The boxes are too wide to fit in the window")
+            
+        # calculate the total width of the line and the leftmost x position
+        lineW = width*n + spacing*(n-1)
+        leftX = center[0] - lineW/2
+    
+        for i in range(n):
+            x = leftX + (i + 0.5)*width + i*spacing
+            positions[f"P{i+1}"] = [x, center[1]]
+            
+    elif direction == "vertical":
+        
+        # check if the boxes are too tall
+        if height*n + spacing*(n-1) > winH:
+            raise ValueError("The boxes are too tall to fit in the window")
+            
+        # calculate the total height of the line and the bottommost y position
+        lineH = height*n + spacing*(n-1)
+        topY = center[1] + lineH/2
+
+        for i in range(n):
+            y = topY - (i + 0.5)*height - i*spacing
+            positions[f"P{i+1}"] = [center[0], y]
+    
+    return positions
+
+
+def _arrange_grid(n, width, height, winW, winH, nrow:int, ncol:int, center=[0,0], spacing = [0,0]):
+    '''Arrange the boxes in a grid
+
+    Args:
+        nrow (int): The number of rows in the grid.
+        ncol (int): The number of columns in the grid.
+        center (list, optional): The center of the grid. Defaults to [0,0].
+        spacing (list, optional): The spacing between boxes in the grid. Defaults to [0,0].
+    '''
+    
+    # check if the grid is too small or too large
+    if nrow*ncol < n:
+        raise ValueError("The grid is too small to fit all the boxes")
+    elif nrow*ncol > n:
+        warnings.warn("There are empty spaces in the grid")
+        
+    # check if the boxes are too wide or too tall
+    if width*ncol + spacing[0]*(ncol-1) > winW*0.9:
+        raise ValueError("The boxes are too wide to fit in the window")
+
+    if height*nrow + spacing[1]*(nrow-1) > winH*0.9:
+        raise ValueError("The boxes are too tall to fit in the window")
+
+        
+    # Calculate the total width and height of the grid
+    gridW = ncol * width + (ncol - 1) * spacing[0]
+    gridH = nrow * height + (nrow - 1) * spacing[1]
+
+    # Calculate offsets to center the grid at `center`
+    leftX = center[0] - gridW / 2
+    topY = center[1] + gridH / 2
+
+    # Initialize the positions
+    positions = {}
+
+    for i in range(n):
+        row = i // ncol
+        col = i % ncol
+        x = leftX + (col + 0.5) * width + col * spacing[0]
+        y = topY - (row + 0.5) * height - row * spacing[1]
+        positions[f"P{i+1}"] = [x, y]
+    
+    return positions
+
+
+def _arrange_random(n, width, height, winH, area=None, spacing:float=0):
+    '''Randomly arrange the boxes
+
+    Args:
+        area (list, optional): The width and height of the area. Defaults to the window height for both.
+        spacing (float, optional): The spacing between boxes. Defaults to 0.
+    '''
+    
+    areaW, areaH = [winH, winH] if area is None else area
+    
+    # the size of a cell
+    cellWidth = width + spacing
+    cellHeight = height + spacing
+    
+    # number of cells in the area
+    nrow = int(areaH/cellHeight)
+    ncol = int(areaW/cellWidth)
+    
+    # the width and height of the area
+    areaW = ncol*cellWidth
+    areaH = nrow*cellHeight
+    
+    # calculate the left and top position of the area
+    leftX = -areaW/2
+    topY = areaH/2
+    
+    # check if the area is too small
+    if nrow*ncol < n:
+        raise ValueError("The area is too small to fit all the boxes")
+    
+    # Generate all possible cell indices
+    cells = [(i, j) for i in range(nrow) for j in range(ncol)]
+    
+    # Shuffle the list of cells to randomize the placement
+    random.shuffle(cells)
+    
+    # Select the first n cells for placement
+    selected_cells = cells[:n]
+    
+    # Initialize the positions
+    positions = {}
+    
+    # Convert cell indices to actual positions
+    for i in range(n):
+        row = selected_cells[i][0]
+        col = selected_cells[i][1]
+        x = leftX + (col + 0.5)*cellWidth
+        y = topY - (row + 0.5)*cellHeight
+        positions[f"P{i+1}"] = [x, y]
+    
+    return positions
+
+
+def _arrange_custom(n, width, height, winW, winH, positions:dict, check:bool=True):
+    '''Arrange the boxes based on custom positions
+
+    Args:
+        positions (dict): A dictionary of positions for each box.
+            The keys are the names of the boxes, and the values are the positions of the boxes.
+        check (bool, optional): Whether to raise an error if boxes overlap or are outside the window. Defaults to True.
+    '''
+    
+    # check if the number of positions matches the number of boxes
+    if len(positions) != n:
+        raise ValueError("The number of positions should match the number of boxes")
+    
+    positions = {f"P{i+1}": list(positions[f"P{i+1}"]) for i in range(n)}
+    
+    # check if the boxes overlap or are outside the window
+    if check:
+        problems = check_boxes(list(positions), list(positions.values()), [width, height], [-winW/2, -winH/2, winW/2, winH/2])
+        if problems["overlaps"]:
+            pairs = [f"{a}-{b}" for a, b in problems["overlaps"]]
+            more = f" (and {len(pairs) - 10} more)" if len(pairs) > 10 else ""
+            raise ValueError(f"The boxes overlap: {', '.join(pairs[:10])}{more}")
+        if problems["off_screen"]:
+            raise ValueError(f"The boxes are outside the window: {', '.join(problems['off_screen'])}")
+    
+    return positions
@@ -0,0 +1,76 @@
+"""
+Vectorized motion for stimBoxes. The positions and velocities of all boxes are arrays
+with one row of [x, y] per box, in height units (velocities per second).
+"""
+
+import numpy as np
+
+
+def rotating(center = [0, 0], speed:float = 30):
+    '''A trajectory that rotates the boxes around a center
+
+    Args:
+        center (list, optional): The center of the rotation. Defaults to [0, 0].
+        speed (float, optional): The speed of the rotation in degrees per second,
+            in the same direction as the rotation argument of the circle layout. Defaults to 30.
+
+    Returns:
+        callable: a trajectory function for `stimBoxes.set_motion`
+    '''
+
+    center = np.asarray(center, dtype=float)
+
+    def trajectory(t, start):
+        angle = np.deg2rad(speed*t)
+        offset = start - center
+        return center + offset @ np.array([[np.cos(angle), np.sin(angle)], [-np.sin(angle), np.cos(angle)]])
+
+    return trajectory
+
+
+def bounce_walls(positions, velocities, sizes, bounds):
+    '''Reflect the boxes that cross the walls of the area
+
+    Args:
+        positions (numpy.ndarray): The positions of the boxes. Updated in place.
+        velocities (numpy.ndarray): The velocities of the boxes. Updated in place.
+        sizes (numpy.ndarray): The sizes of the boxes, one row of [width, height] per box.
+        bounds (numpy.ndarray): The area, as [left, bottom, right, top].
+    '''
+
+    low = bounds[:2] + sizes/2
+    high = bounds[2:] - sizes/2
+
+    # reverse the velocities that move out of the area
+    out = ((positions < low) & (velocities < 0)) | ((positions > high) & (velocities > 0))
+    velocities[out] *= -1
+    np.clip(positions, low, high, out=positions)
+
+
+def collide(positions, velocities, sizes):
+    '''Elastic collisions between boxes of equal mass, approximating the boxes as circles
+
+    Args:
+        positions (numpy.ndarray): The positions of the boxes.
+        velocities (numpy.ndarray): The velocities of the boxes. Updated in place.
+        sizes (numpy.ndarray): The sizes of the boxes, one row of [width, height] per box.
+    '''
+
+    radius = sizes.max(axis=1)/2
+
+    # all pairs of boxes
+    i, j = np.triu_indices(len(positions), k=1)
+    delta = positions[j] - positions[i]
+    dist = np.hypot(delta[:, 0], delta[:, 1])
+
+    # the pairs that overlap and move towards each other
+    approach = np.einsum("ij,ij->i", velocities[j] - velocities[i], delta)
+    hit = (dist < radius[i] + radius[j]) & (dist > 0) & (approach < 0)
+    if not hit.any():
+        return
+
+    # exchange the velocity components along the line between the centers
+    i, j, delta, dist, approach = i[hit], j[hit], delta[hit], dist[hit], approach[hit]
+    impulse = (approach/dist**2)[:, None]*delta
+    np.add.at(velocities, i, impulse)
+    np.add.at(velocities, j, -impulse)
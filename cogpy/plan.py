@@ -0,0 +1,544 @@
+"""
+Compile a declarative experiment spec (YAML or JSON) into an execution plan.
+
+The compiler validates the whole experiment before the session starts (layouts, image files,
+and response choices) and resolves everything that would otherwise be computed during the session,
+such as the positions of random layouts. The plan can be cached to disk and loaded at the start of the session,
+and the images of all trials are decoded when the plan starts running.
+
+A spec looks like this (in JSON or YAML):
+
+    {
+        "window": {"size": [1600, 900]},
+        "seed": 1,
+        "trial_defaults": {"resp_type": "key", "choices": ["f", "j"]},
+        "blocks": [
+            {
+                "name": "practice",
+                "instructions": ["Welcome to the experiment.", "instructions/page2.png"],
+                "randomize": {"by": "condition", "max_repeat": 2, "balance_transitions": true},
+                "trials": [
+                    {
+                        "layout": {"setsize": 6, "layout": "circle", "radius": 0.3, "width": 0.2},
+                        "text": ["A", "B", "C", "D", "E", "F"],
+                        "duration": 5,
+                        "data": {"condition": "letters"}
+                    }
+                ]
+            }
+        ]
+    }
+
+Relative image paths are resolved from the folder of the spec file.
+"""
+
+from pathlib import Path
+import hashlib
+import inspect
+import json
+import random
+import numpy as np
+from psychopy.visual import TextStim, ImageStim
+from psychopy.visual.rect import Rect # psychopy.visual imports Rect lazily, without its signature
+from .layout import stimBoxes, layout_positions
+from .image import load_image
+from .trial import trial
+from .instruction import instr_loop
+from .randomize import order_trials
+
+image_suffixes = [".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff"]
+trial_keys = ["resp_type", "choices", "resp_start", "resp_end_trial", "duration", "post_trial_gap", "quit_key", "track_mouse", "track_rate", "track_capacity"]
+layout_keys = ["center", "radius", "oval", "rotation", "direction", "spacing", "nrow", "ncol", "area", "positions", "check"]
+plan_version = 2
+
+
+def _stim_args(stim, extra:list = [], fixed:list = []):
+    '''The names of the arguments of a PsychoPy stimulus that a spec can set
+
+    Args:
+        stim (type): The stimulus class.
+        extra (list, optional): The arguments that cogpy adds. Defaults to [].
+        fixed (list, optional): The arguments that cogpy sets itself. Defaults to [].
+
+    Returns:
+        set | None: the names of the arguments, or None if the stimulus takes any argument.
+    '''
+
+    params = inspect.signature(stim).parameters
+    if any(p.kind == p.VAR_KEYWORD for p in params.values()):
+        return None
+    return (set(params) | set(extra)) - {"win"} - set(fixed)
+
+
+def load_spec(path):
+    '''Load a spec from a YAML or JSON file
+
+    Args:
+        path (str): The path of the spec file.
+
+    Returns:
+        dict: the spec
+    '''
+
+    path = Path(path)
+    with open(path) as f:
+        if path.suffix.lower() in [".yaml", ".yml"]:
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required to read YAML specs (pip install pyyaml)")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+class experimentPlan(object):
+    ''' A compiled execution plan
+
+    Args:
+        steps (list): the steps of the session in order. Each step is a dict with a "type" of
+            "instructions" or "trial" and the resolved arguments of the step.
+        window (dict): the window settings of the spec.
+        key (str): the hash of the spec the plan was compiled from.
+            Plans with random layouts or orders without a seed also include the resolved steps in the hash.
+        files (dict, optional): the size and modification time of each image file of the plan. Defaults to None.
+    '''
+
+    def __init__(self, steps:list, window:dict, key:str = "", files:dict = None):
+        self.steps = steps
+        self.window = window
+        self.key = key
+        self.files = {} if files is None else files
+        self.preloaded = None
+
+    @property
+    def trials(self):
+        '''The trial steps of the plan'''
+        return [step for step in self.steps if step["type"] == "trial"]
+
+    def save(self, path):
+        '''Save the plan to a JSON file
+
+        Args:
+            path (str): The path of the plan file.
+        '''
+
+        with open(path, "w") as f:
+            json.dump({"version": plan_version, "key": self.key, "window": self.window, "steps": self.steps, "files": self.files}, f)
+
+    @classmethod
+    def load(cls, path):
+        '''Load a plan saved with `save`
+
+        Args:
+            path (str): The path of the plan file.
+
+        Returns:
+            experimentPlan: the plan
+        '''
+
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != plan_version:
+            raise ValueError("The plan was saved by another version of cogpy and should be compiled again")
+        return cls(data["steps"], data["window"], data["key"], data["files"])
+
+    def files_changed(self):
+        '''Whether an image file of the plan was removed or changed since the plan was compiled'''
+
+        for path, stamp in self.files.items():
+            try:
+                stat = Path(path).stat()
+            except OSError:
+                return True
+            if [stat.st_size, stat.st_mtime_ns] != stamp:
+                return True
+        return False
+
+    def preload(self, win):
+        '''Decode the images of all trials at the pixel size of their boxes in the window
+
+        Args:
+            win (Any): the window object from psychopy
+
+        Returns:
+            dict: the decoded images (as arrays) by path. They are used by `build_trial` for this window.
+        '''
+
+        winPix = win.size[1] # window height in pixels
+        images = {}
+        for step in self.trials:
+            content = step.get("image")
+            if content is None:
+                continue
+            box_args = step["layout"]["box_args"]
+            image_args = step.get("image_args", {})
+            scale = image_args.get("scale", 1)
+            target = [box_args["width"]*scale*winPix, box_args["height"]*scale*winPix]
+            for path in content.values() if isinstance(content, dict) else content:
+                key = (path, round(target[0]), round(target[1]))
+                if key in images:
+                    continue
+                image = load_image(path, target, draft=image_args.get("draft", True), cache_dir=image_args.get("cache_dir"))
+                if image.mode not in ["L", "RGB", "RGBA"]:
+                    image = image.convert("RGBA")
+                images[key] = np.asarray(image)
+
+        self.preloaded = (win, winPix, images)
+        return images
+
+    @staticmethod
+    def build_stimuli(win, step:dict, images:dict = None):
+        '''Create the stimuli of a trial step
+
+        Args:
+            win (Any): the window object from psychopy
+            step (dict): a trial step of the plan
+            images (dict, optional): the decoded images from `preload`. Defaults to None (the image files are decoded).
+
+        Returns:
+            stimBoxes: the boxes with their text and image stimuli
+        '''
+
+        layout = step["layout"]
+        boxes = stimBoxes(win, layout["setsize"], layout="custom", positions=layout["positions"], check=False, **layout["box_args"])
+        if step.get("image") is not None:
+            content = step["image"]
+            image_args = step.get("image_args", {})
+            if images is not None:
+                scale = image_args.get("scale", 1)
+                size = (round(layout["box_args"]["width"]*scale*win.size[1]), round(layout["box_args"]["height"]*scale*win.size[1]))
+                decoded = lambda path: images.get((path,) + size, path)
+                if isinstance(content, dict):
+                    content = {box: decoded(path) for box, path in content.items()}
+                else:
+                    content = [decoded(path) for path in content]
+            boxes.stim_image(content, **image_args)
+        if step.get("text") is not None:
+            boxes.stim_text(step["text"], **step.get("text_args", {}))
+
+        return boxes
+
+    def build_trial(self, win, step:dict):
+        '''Create the stimuli and the trial object of a trial step
+
+        Args:
+            win (Any): the window object from psychopy
+            step (dict): a trial step of the plan
+
+        Returns:
+            trial: the trial object
+        '''
+
+        images = None
+        if self.preloaded is not None and self.preloaded[0] is win and self.preloaded[1] == win.size[1]:
+            images = self.preloaded[2]
+        return trial(win, stimuli=[self.build_stimuli(win, step, images)], **step["trial_args"])
+
+    def run(self, win, start:int = 0, journal = None, telemetry = None, stats = None):
+        '''Run the plan
+
+        Args:
+            win (Any): the window object from psychopy
+            start (int, optional): the index of the first trial to run.
+                The instructions of the blocks before the first trial are skipped. Defaults to 0.
+            journal (sessionJournal, optional): a journal of the session. Each completed trial is appended to the journal,
+                and the trials that are already in the journal are skipped, so that a crashed session
+                can be resumed with the same journal. The journal is bound to the key of the plan,
+                and a journal of another plan raises a ValueError. Defaults to None.
+            telemetry (sessionTelemetry, optional): publishes the state of the session after each trial
+                for a monitor process. Defaults to None.
+            stats (conditionStats, optional): running statistics that are updated with each result.
+                When resuming, the results of the journal are added first. Defaults to None.
+
+        Returns:
+            list: the results of the trials. Each result contains the block name, the trial index,
+                the data of the trial, the response, and the onset and offset of the trial.
+                When resuming, the results of the completed trials are read from the journal.
+        
+        Description:
+            The images of all trials are decoded before the first step (see `preload`), 
+            so the trials only create their stimulus objects from decoded images.
+        '''
+
+        if journal is not None:
+            journal.bind(self.key)
+        self.preload(win)
+
+        done = set() if journal is None else journal.completed()
+        results = [] if journal is None else list(journal.records)
+        if stats is not None:
+            for result in results:
+                stats.update(result)
+        
+        for step in self.steps:
+            if step["type"] == "instructions":
+                # skip the instructions of blocks that were already started
+                if step["next_trial"] < start or step["next_trial"] in done:
+                    continue
+                instr_loop(win, step["contents"], **step["args"])
+            else:
+                if step["trial_index"] < start or step["trial_index"] in done:
+                    continue
+                current = self.build_trial(win, step)
+                current.run()
+                result = self.result(step, current.get_response())
+                result["onset"] = current.onset
+                result["offset"] = current.offset
+                results.append(result)
+                if journal is not None:
+                    journal.append(result)
+                if stats is not None:
+                    stats.update(result)
+                if telemetry is not None:
+                    telemetry.publish(step["trial_index"], current.rt, current.dropped_frames, current.poll_rate)
+
+        return results
+
+    @staticmethod
+    def result(step:dict, response:dict):
+        '''Combine a trial step and its response into one result'''
+
+        result = {"block": step["block"], "trial_index": step["trial_index"]}
+        result.update(step.get("data", {}))
+        result.update(response)
+        return result
+
+
+def compile_plan(spec, cache = None, base_dir = None):
+    '''Validate a spec and compile it into an execution plan
+
+    Args:
+        spec (str | dict): The spec, or the path of a YAML or JSON spec file.
+        cache (str, optional): The path of the plan cache. If the cached plan was compiled from the same spec
+            and its image files did not change, it is loaded instead of compiling the spec again. 
+            Otherwise the compiled plan is saved there. Plans with random layouts or orders without a seed 
+            are never cached, so that each session gets new positions. Defaults to None.
+        base_dir (str, optional): The folder for relative image paths. Defaults to the folder of the spec file,
+            or the current folder if the spec is a dict.
+
+    Raises:
+        ValueError: The spec is not valid. The message lists all problems that were found.
+
+    Returns:
+        experimentPlan: the plan
+    '''
+
+    if isinstance(spec, (str, Path)):
+        base_dir = Path(spec).parent if base_dir is None else base_dir
+        spec = load_spec(spec)
+    base_dir = Path("." if base_dir is None else base_dir)
+
+    key = hashlib.sha1(json.dumps([spec, str(base_dir.resolve())], sort_keys=True, default=str).encode()).hexdigest()
+    if cache is not None and Path(cache).exists():
+        try:
+            plan = experimentPlan.load(cache)
+        except ValueError:
+            plan = None
+        if plan is not None and plan.key == key and not plan.files_changed():
+            return plan
+
+    compiler = _compiler(spec, base_dir)
+    steps = compiler.compile()
+    if compiler.unseeded:
+        # the plan differs from one compilation to the next
+        key = hashlib.sha1(json.dumps([key, steps], sort_keys=True, default=str).encode()).hexdigest()
+    plan = experimentPlan(steps, compiler.window, key, compiler.files)
+
+    if cache is not None and not compiler.unseeded:
+        plan.save(cache)
+
+    return plan
+
+
+class _compiler(object):
+    ''' Validate and resolve the blocks of a spec, collecting all problems before raising them'''
+
+    def __init__(self, spec:dict, base_dir:Path):
+        self.spec = spec
+        self.base_dir = base_dir
+        self.errors = []
+        self.files = {}
+        self.unseeded = False # whether random layouts or orders were resolved without a seed
+
+        self.window = dict(spec.get("window", {}))
+        size = self.window.get("size", [1600, 900])
+        self.window["size"] = size
+        self.winW = size[0]/size[1]
+
+        # the arguments of the boxes, the text and the images (see stimBoxes)
+        self.stim_args = {
+            "layout": _stim_args(Rect, layout_keys, ["pos"]),
+            "text_args": _stim_args(TextStim, fixed=["text", "pos"]),
+            "image_args": _stim_args(ImageStim, ["scale", "draft", "cache_dir"], ["image", "pos"])
+        }
+
+    def compile(self):
+
+        if not isinstance(self.spec.get("blocks"), list) or len(self.spec["blocks"]) == 0:
+            raise ValueError("The spec should have a list of blocks")
+
+        steps = []
+        trial_index = 0
+
+        # resolve the random layouts with the seed of the spec, without changing the global random state
+        # (without a seed, the global random state is used and advanced, so each compilation differs)
+        state = random.getstate()
+        if "seed" in self.spec:
+            random.seed(self.spec["seed"])
+        try:
+            for b, block in enumerate(self.spec["blocks"]):
+                where = f"blocks[{b}]"
+                name = block.get("name", f"block{b+1}")
+
+                if block.get("instructions"):
+                    steps.append({
+                        "type": "instructions",
+                        "block": name,
+                        "next_trial": trial_index,
+                        "contents": [self.__page(page, f"{where}.instructions[{i}]") for i, page in enumerate(block["instructions"])],
+                        "args": block.get("instruction_args", {})
+                    })
+
+                defaults = dict(self.spec.get("trial_defaults", {}))
+                defaults.update(block.get("trial_defaults", {}))
+
+                trials = list(enumerate(block.get("trials", [])))
+                if "randomize" in block:
+                    trials = self.__randomize(trials, block["randomize"], f"{where}.randomize", b)
+
+                for t, spec_trial in trials:
+                    merged = dict(defaults)
+                    merged.update(spec_trial)
+                    step = self.__trial(merged, f"{where}.trials[{t}]")
+                    if step is not None:
+                        step.update({"block": name, "trial_index": trial_index})
+                        steps.append(step)
+                    trial_index += 1
+        finally:
+            if "seed" in self.spec:
+                random.setstate(state)
+
+        if len(self.errors) > 0:
+            raise ValueError("The spec is not valid:\n" + "\n".join(self.errors))
+
+        return steps
+
+    def __randomize(self, trials:list, options:dict, where:str, b:int):
+        '''Reorder the trials of a block under constraints on their conditions'''
+
+        by = options.get("by")
+        self.unseeded = self.unseeded or "seed" not in self.spec
+        if any(by not in spec_trial.get("data", {}) for _, spec_trial in trials):
+            self.errors.append(f"{where}: every trial should have the condition {by} in its data")
+            return trials
+
+        try:
+            return order_trials(
+                trials, lambda pair: pair[1]["data"][by],
+                max_repeat = options.get("max_repeat"),
+                balance_transitions = options.get("balance_transitions", False),
+                seed = None if "seed" not in self.spec else [self.spec["seed"], b])
+        except ValueError as e:
+            self.errors.append(f"{where}: {e}")
+            return trials
+
+    def __page(self, page:str, where:str):
+        '''Resolve an instruction page. Pages that look like image files should exist.'''
+
+        if Path(str(page)).suffix.lower() in image_suffixes:
+            return self.__image(page, where)
+        return page
+
+    def __image(self, image:str, where:str):
+        '''Resolve an image path and check that it exists'''
+
+        path = Path(str(image))
+        if not path.is_absolute():
+            path = self.base_dir / path
+        if not path.exists():
+            self.errors.append(f"{where}: the image {image} does not exist")
+        else:
+            stat = path.stat()
+            self.files[str(path)] = [stat.st_size, stat.st_mtime_ns]
+        return str(path)
+
+    def __trial(self, spec:dict, where:str):
+        '''Validate and resolve a trial'''
+
+        n_errors = len(self.errors)
+
+        unknown = set(spec) - set(trial_keys) - {"layout", "text", "text_args", "image", "image_args", "data"}
+        if unknown:
+            self.errors.append(f"{where}: unknown arguments {', '.join(sorted(unknown))}")
+
+        # the layout
+        layout = dict(spec.get("layout", {}))
+        setsize = layout.pop("setsize", None)
+        if not isinstance(setsize, int) or setsize < 1:
+            self.errors.append(f"{where}.layout: the setsize should be a positive integer")
+            return None
+        kind = layout.pop("layout", "line")
+        self.unseeded = self.unseeded or (kind == "random" and "seed" not in self.spec)
+        box_args = {k: v for k, v in layout.items() if k not in layout_keys}
+        box_args["width"] = box_args.get("width", 0.16)
+        box_args["height"] = box_args.get("height", box_args["width"])
+        try:
+            positions = layout_positions(setsize, kind, winW=self.winW, **layout)
+        except (ValueError, TypeError, KeyError) as e:
+            self.errors.append(f"{where}.layout: {e}")
+            positions = None
+
+        # the arguments of the stimuli, which would otherwise only fail when the trial is shown
+        for name, args in [("layout", layout), ("text_args", spec.get("text_args", {})), ("image_args", spec.get("image_args", {}))]:
+            if not isinstance(args, dict):
+                self.errors.append(f"{where}.{name}: the arguments should be a dict")
+                continue
+            allowed = self.stim_args[name]
+            unknown = set() if allowed is None else set(args) - allowed
+            if unknown:
+                self.errors.append(f"{where}.{name}: unknown arguments {', '.join(sorted(unknown))}")
+
+        # the stimuli
+        for name in ["text", "image"]:
+            content = spec.get(name)
+            if content is None:
+                continue
+            if isinstance(content, list):
+                if len(content) != setsize:
+                    self.errors.append(f"{where}.{name}: the number of stimuli should match the number of boxes")
+            elif isinstance(content, dict):
+                missing = set(content) - {f"P{i+1}" for i in range(setsize)}
+                if missing:
+                    self.errors.append(f"{where}.{name}: unknown boxes {', '.join(sorted(missing))}")
+            else:
+                self.errors.append(f"{where}.{name}: the stimuli should be a list or a dict")
+        image = spec.get("image")
+        if isinstance(image, list):
+            image = [self.__image(x, f"{where}.image") for x in image]
+        elif isinstance(image, dict):
+            image = {box: self.__image(x, f"{where}.image") for box, x in image.items()}
+
+        # the response
+        trial_args = {k: spec[k] for k in trial_keys if k in spec}
+        resp_type = trial_args.get("resp_type", "key")
+        choices = trial_args.get("choices")
+        if resp_type not in ["key", "button"]:
+            self.errors.append(f"{where}: the response type should be key or button in a spec")
+        elif choices is not None and (not isinstance(choices, list) or not all(isinstance(c, str) for c in choices)):
+            self.errors.append(f"{where}.choices: the choices should be a list of strings")
+        elif resp_type == "button" and not choices:
+            self.errors.append(f"{where}.choices: button trials need at least one choice")
+
+        if len(self.errors) > n_errors:
+            return None
+
+        return {
+            "type": "trial",
+            "layout": {"setsize": setsize, "positions": positions, "box_args": box_args},
+            "text": spec.get("text"),
+            "text_args": spec.get("text_args", {}),
+            "image": image,
+            "image_args": spec.get("image_args", {}),
+            "trial_args": trial_args,
+            "data": spec.get("data", {})
+        }
@@ -0,0 +1,214 @@
+"""
+Opt-in profiling of cogpy sessions.
+
+The stimBoxes constructors and draw methods, the phases of trial.run, and the instruction loops
+are instrumented with spans. Each response loop is one span, and the time spent polling the keyboard
+and the mouse (or the gaze source) in a loop is recorded as one span per loop rather than one per iteration. Profiling is disabled by default: an instrumented call then only
+checks one flag. After `enable()`, each span is stored in a preallocated ring buffer,
+and `export_chrome_trace` writes the spans as a Chrome trace (JSON) that can be opened
+in chrome://tracing or https://ui.perfetto.dev.
+
+    import cogpy.profiling as profiling
+
+    profiling.enable()
+    ...  # run the session
+    profiling.export_chrome_trace("session_trace.json")
+"""
+
+from itertools import count
+import functools
+import json
+import os
+import threading
+import time
+import numpy as np
+
+_enabled = False
+_capacity = 0
+_counter = count()
+_recorded = 0
+_start = np.zeros(0, dtype=np.int64)
+_duration = np.zeros(0, dtype=np.int64)
+_name = np.zeros(0, dtype=np.int32)
+_thread = np.zeros(0, dtype=np.int64)
+_names = {}
+
+
+def enable(capacity:int = 100000):
+    '''Start recording spans
+
+    Args:
+        capacity (int, optional): The number of spans kept in the ring buffer.
+            When the buffer is full, the oldest spans are overwritten. Defaults to 100000.
+    '''
+
+    global _enabled, _capacity, _counter, _recorded, _start, _duration, _name, _thread
+    _capacity = capacity
+    _counter = count()
+    _recorded = 0
+    _start = np.zeros(capacity, dtype=np.int64)
+    _duration = np.zeros(capacity, dtype=np.int64)
+    _name = np.zeros(capacity, dtype=np.int32)
+    _thread = np.zeros(capacity, dtype=np.int64)
+    _enabled = True
+
+
+def disable():
+    '''Stop recording spans. The recorded spans are kept until the next `enable`.'''
+
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def record(name:str, start:int, end:int):
+    '''Store a span in the ring buffer
+
+    Args:
+        name (str): The name of the span.
+        start (int): The start time from time.perf_counter_ns().
+        end (int): The end time from time.perf_counter_ns().
+    '''
+
+    global _recorded
+    if not _enabled:
+        return
+    n = next(_counter)
+    i = n % _capacity
+    _start[i] = start
+    _duration[i] = end - start
+    _name[i] = _names.setdefault(name, len(_names))
+    _thread[i] = threading.get_ident()
+    _recorded = n + 1
+
+
+class _span(object):
+
+    __slots__ = ["name", "start"]
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, self.start, time.perf_counter_ns())
+
+
+class _total(object):
+
+    __slots__ = ["name", "first", "begin", "elapsed"]
+
+    def __init__(self, name):
+        self.name = name
+        self.first = None
+        self.elapsed = 0
+
+    def __enter__(self):
+        self.begin = time.perf_counter_ns()
+        if self.first is None:
+            self.first = self.begin
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed += time.perf_counter_ns() - self.begin
+
+    def record(self):
+        if self.first is not None:
+            record(self.name, self.first, self.first + self.elapsed)
+
+
+class _null_span(object):
+
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def record(self):
+        pass
+
+
+_null = _null_span()
+
+
+def span(name:str):
+    '''A context manager that records the time spent in its block
+
+    Args:
+        name (str): The name of the span, e.g. "trial.flip".
+    '''
+
+    return _span(name) if _enabled else _null
+
+
+def total(name:str):
+    '''A context manager for a block that runs many times, e.g. in each iteration of a loop
+
+    Args:
+        name (str): The name of the span, e.g. "trial.poll".
+
+    Description:
+        The time spent in all runs of the block is summed, and `record()` stores it as one span
+        that starts at the first run, so a loop does not fill the ring buffer.
+    '''
+
+    return _total(name) if _enabled else _null
+
+
+def profiled(name:str):
+    '''A decorator that records each call of a function as a span
+
+    Args:
+        name (str): The name of the span, e.g. "stimBoxes.draw".
+    '''
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, start, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+
+def spans():
+    '''Get the recorded spans in time order
+
+    Returns:
+        list: the spans, each a tuple of (name, start in ns, duration in ns, thread id)
+    '''
+
+    n = min(_recorded, _capacity)
+    names = {i: name for name, i in _names.items()}
+    order = np.argsort(_start[:n], kind="stable")
+    return [(names[_name[i]], int(_start[i]), int(_duration[i]), int(_thread[i])) for i in order]
+
+
+def export_chrome_trace(path):
+    '''Write the recorded spans as a Chrome trace
+
+    Args:
+        path (str): The path of the JSON file.
+    '''
+
+    pid = os.getpid()
+    events = [
+        {"name": name, "cat": name.split(".")[0], "ph": "X", "ts": start/1000, "dur": duration/1000, "pid": pid, "tid": thread}
+        for name, start, duration, thread in spans()
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,203 @@
+"""
+Constrained trial orders. Conditions are encoded as integers 0..k-1, and orders are NumPy arrays of condition codes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+
+def constrained_order(counts, max_repeat = None, balance_transitions = False, seed = None, max_steps = 1000000):
+    '''Generate a random order of conditions that satisfies the constraints
+
+    Args:
+        counts (list): The number of trials of each condition.
+        max_repeat (int, optional): The maximum number of trials of the same condition in a row. Defaults to None (no limit).
+        balance_transitions (bool, optional): Whether to balance the transitions between conditions,
+            so that each condition is followed by each condition about equally often. Defaults to False.
+        seed (int, optional): The random seed. Defaults to None.
+        max_steps (int, optional): The maximum number of placement steps (including backtracking) before giving up.
+            Defaults to 1000000.
+
+    Raises:
+        ValueError: No order satisfies the constraints.
+
+    Returns:
+        numpy.ndarray: the condition code of each trial
+    '''
+
+    rng = np.random.default_rng(seed)
+    remaining = np.array(counts, dtype=int)
+    if np.any(remaining < 0):
+        raise ValueError("The counts should not be negative")
+    k = len(remaining)
+    n = int(remaining.sum())
+    m = n if max_repeat is None else max_repeat
+    if m < 1:
+        raise ValueError("The maximum number of repeats should be at least 1")
+
+    order = np.empty(n, dtype=int)
+    runs = np.zeros(n, dtype=int) # the length of the run that ends at each position
+    transitions = np.zeros((k, k), dtype=int)
+    candidates = [None]*n # the conditions left to try at each position
+
+    pos = 0
+    steps = 0
+    while pos < n:
+        steps += 1
+        if steps > max_steps:
+            raise ValueError("No order was found that satisfies the constraints")
+
+        if candidates[pos] is None:
+            candidates[pos] = list(_candidates(rng, remaining, order, runs, transitions, pos, m, balance_transitions))
+
+        if len(candidates[pos]) == 0:
+            # backtrack to the previous position
+            candidates[pos] = None
+            pos -= 1
+            if pos < 0:
+                raise ValueError("No order satisfies the constraints")
+            c = order[pos]
+            remaining[c] += 1
+            if pos > 0:
+                transitions[order[pos-1], c] -= 1
+            continue
+
+        # place the next candidate
+        c = candidates[pos].pop(0)
+        order[pos] = c
+        runs[pos] = runs[pos-1] + 1 if pos > 0 and order[pos-1] == c else 1
+        remaining[c] -= 1
+        if pos > 0:
+            transitions[order[pos-1], c] += 1
+        pos += 1
+
+    return order
+
+
+def _candidates(rng, remaining, order, runs, transitions, pos, m, balance_transitions):
+    '''The conditions that can be placed at a position, in a random order weighted by the remaining counts'''
+
+    last = order[pos-1] if pos > 0 else -1
+    run = runs[pos-1] if pos > 0 else 0
+
+    allowed = remaining > 0
+    if last >= 0 and run >= m:
+        allowed[last] = False
+
+    # keep only the conditions after which all remaining trials can still be placed:
+    # a condition with r trials needs at least ceil(r/m) - 1 trials of other conditions between its runs
+    codes = np.flatnonzero(allowed)
+    total = remaining.sum() - 1
+    feasible = []
+    for c in codes:
+        rest = remaining.copy()
+        rest[c] -= 1
+        capacity = m*(total - rest + 1)
+        capacity[c] -= run + 1 if c == last else 1
+        if np.all(rest <= capacity):
+            feasible.append(c)
+    codes = np.array(feasible, dtype=int)
+    if len(codes) == 0:
+        return codes
+
+    weights = remaining[codes].astype(float)
+    if balance_transitions and last >= 0:
+        weights /= 1 + transitions[last, codes]
+    return rng.choice(codes, size=len(codes), replace=False, p=weights/weights.sum())
+
+
+def balanced_latin_square(n:int):
+    '''A balanced Latin square for counterbalancing n conditions across participants
+
+    Args:
+        n (int): The number of conditions.
+
+    Returns:
+        numpy.ndarray: the square, one order per row. For an odd n, the square has 2n rows
+            (each row followed by its reverse), so that each condition follows each other condition equally often.
+    '''
+
+    # the first row is 0, 1, n-1, 2, n-2, ...
+    first = [0]
+    low, high = 1, n - 1
+    for i in range(1, n):
+        if i % 2 == 1:
+            first.append(low)
+            low += 1
+        else:
+            first.append(high)
+            high -= 1
+    first = np.array(first)
+    square = (first[None, :] + np.arange(n)[:, None]) % n
+    if n % 2 == 1:
+        square = np.concatenate([square, square[:, ::-1]])
+    return square
+
+
+def counterbalance(items:list, participant:int):
+    '''The order of items for a participant, from a balanced Latin square
+
+    Args:
+        items (list): The items to counterbalance (e.g., conditions or blocks).
+        participant (int): The participant number, starting from 0.
+
+    Returns:
+        list: the items in the order of the participant
+    '''
+
+    square = balanced_latin_square(len(items))
+    return [items[i] for i in square[participant % len(square)]]
+
+
+def order_trials(trials:list, condition, max_repeat = None, balance_transitions = False, seed = None):
+    '''Reorder a list of trials under constraints on their conditions
+
+    Args:
+        trials (list): The trials, e.g., trial objects or trial specs.
+        condition (str | callable): The condition of a trial, either a function of the trial or a key of the trial dict.
+        max_repeat (int, optional): The maximum number of trials of the same condition in a row. Defaults to None.
+        balance_transitions (bool, optional): Whether to balance the transitions between conditions. Defaults to False.
+        seed (int, optional): The random seed. Defaults to None.
+
+    Returns:
+        list: the reordered trials. Trials of the same condition are shuffled.
+    '''
+
+    labels = [condition(t) if callable(condition) else t[condition] for t in trials]
+    levels, codes = np.unique(np.array(labels, dtype=object).astype(str), return_inverse=True)
+    order = constrained_order(np.bincount(codes, minlength=len(levels)), max_repeat, balance_transitions, seed)
+
+    # fill the positions of each condition with its trials in a random order
+    rng = np.random.default_rng(seed)
+    pools = [list(rng.permutation(np.flatnonzero(codes == c))) for c in range(len(levels))]
+    return [trials[pools[c].pop()] for c in order]
+
+
+def _participant_order(args):
+    counts, max_repeat, balance_transitions, seed = args
+    return constrained_order(counts, max_repeat, balance_transitions, seed)
+
+
+def generate_orders(counts, participants:int, max_repeat = None, balance_transitions = False, seed = None, workers = None):
+    '''Generate constrained orders for many participants
+
+    Args:
+        counts (list): The number of trials of each condition.
+        participants (int): The number of participants.
+        max_repeat (int, optional): The maximum number of trials of the same condition in a row. Defaults to None.
+        balance_transitions (bool, optional): Whether to balance the transitions between conditions. Defaults to False.
+        seed (int, optional): The random seed. Each participant gets an independent random stream. Defaults to None.
+        workers (int, optional): The number of worker processes. Defaults to None (no pool).
+
+    Returns:
+        numpy.ndarray: the orders, one row per participant
+    '''
+
+    seeds = np.random.SeedSequence(seed).spawn(participants)
+    jobs = [(counts, max_repeat, balance_transitions, s) for s in seeds]
+
+    if workers is None or workers <= 1:
+        return np.array([_participant_order(job) for job in jobs])
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return np.array(list(pool.map(_participant_order, jobs, chunksize=max(1, participants//(workers*4)))))
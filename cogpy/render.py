@@ -0,0 +1,149 @@
+"""
+Offline rendering of compiled plans, to check the stimuli of every trial without running the session.
+
+Each worker process opens its own window, draws the stimuli of its trials (and the buttons of button trials) into the back buffer
+(without flipping, so no frame waits for the screen refresh), and saves each frame as a PNG:
+
+    plan = compile_plan("experiment.yaml")
+    render_plan(plan, "renders", workers=8)
+    diff_renders("renders_old", "renders")
+
+PsychoPy needs an X display to open a window. On a headless Linux machine, run the script
+in a virtual framebuffer, e.g. `xvfb-run -a python render_experiment.py`;
+the worker processes use the same display.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def _render_chunk(args):
+    '''Render a chunk of trial steps in one window'''
+
+    steps, window, outdir = args
+
+    from psychopy import visual
+    from .plan import experimentPlan
+    from .trial import choice_buttons
+
+    settings = {"size": [1600, 900], "color": [1, 1, 1]}
+    settings.update(window)
+    win = visual.Window(fullscr=False, allowGUI=False, useFBO=True, checkTiming=False, **settings)
+
+    paths = []
+    try:
+        for step in steps:
+            win.clearBuffer()
+            boxes = experimentPlan.build_stimuli(win, step)
+            boxes.draw()
+            # the buttons of button trials, as drawn by the trial
+            if step["trial_args"].get("resp_type") == "button":
+                choice_buttons(win, step["trial_args"].get("choices")).draw()
+            frame = win.getMovieFrame(buffer="back")
+            win.movieFrames.clear()
+
+            path = Path(outdir, f"trial_{step['trial_index']:05d}.png")
+            frame.convert("RGB").save(path)
+            paths.append(str(path))
+    finally:
+        win.close()
+
+    return paths
+
+
+def render_plan(plan, outdir, workers:int = None, chunk_size:int = 50, contact_sheet:bool = True, columns:int = 10, thumb_width:int = 320):
+    '''Render the stimuli of every trial of a plan to PNG files
+
+    Args:
+        plan (experimentPlan): The compiled plan.
+        outdir (str): The folder of the images. Each trial is saved as trial_{trial_index}.png.
+        workers (int, optional): The number of worker processes, each with its own window.
+            Defaults to None (no pool, the trials are rendered in a window of this process).
+        chunk_size (int, optional): The number of trials rendered by a worker at once. Defaults to 50.
+        contact_sheet (bool, optional): Whether to also save all trials on a single image (contact_sheet.png). Defaults to True.
+        columns (int, optional): The number of columns of the contact sheet. Defaults to 10.
+        thumb_width (int, optional): The width of a trial on the contact sheet in pixels. Defaults to 320.
+
+    Returns:
+        list: the paths of the trial images, in the order of the plan
+    '''
+
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    steps = plan.trials
+    chunks = [(steps[i:i+chunk_size], plan.window, str(outdir)) for i in range(0, len(steps), chunk_size)]
+
+    if workers is None or workers <= 1:
+        results = [_render_chunk(chunk) for chunk in chunks]
+    else:
+        # a new interpreter for each worker, since the OpenGL context of a window cannot be shared with a forked process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            results = list(pool.map(_render_chunk, chunks))
+
+    paths = [path for result in results for path in result]
+    if contact_sheet and len(paths) > 0:
+        make_contact_sheet(paths, outdir / "contact_sheet.png", columns, thumb_width)
+
+    return paths
+
+
+def make_contact_sheet(paths:list, path, columns:int = 10, thumb_width:int = 320):
+    '''Tile images on a single image, each labeled with its file name
+
+    Args:
+        paths (list): The paths of the images.
+        path (str): The path of the contact sheet.
+        columns (int, optional): The number of columns. Defaults to 10.
+        thumb_width (int, optional): The width of an image on the sheet in pixels. Defaults to 320.
+    '''
+
+    with Image.open(paths[0]) as first:
+        thumb_height = round(thumb_width * first.height / first.width)
+    rows = -(-len(paths) // columns)
+    sheet = Image.new("RGB", (columns*thumb_width, rows*thumb_height), "white")
+    draw = ImageDraw.Draw(sheet)
+
+    for i, p in enumerate(paths):
+        x, y = (i % columns)*thumb_width, (i // columns)*thumb_height
+        with Image.open(p) as image:
+            image.draft("RGB", (thumb_width, thumb_height))
+            sheet.paste(image.convert("RGB").resize((thumb_width, thumb_height)), (x, y))
+        draw.rectangle([x, y, x + thumb_width - 1, y + thumb_height - 1], outline="gray")
+        draw.text((x + 4, y + 2), Path(p).stem, fill="red")
+
+    sheet.save(path)
+
+
+def diff_renders(dir_a, dir_b, tolerance:int = 0):
+    '''Compare two folders of trial images, e.g. the renders before and after a change of the spec
+
+    Args:
+        dir_a (str): The first folder.
+        dir_b (str): The second folder.
+        tolerance (int, optional): The largest difference of a pixel value (0-255) that is ignored. Defaults to 0.
+
+    Returns:
+        dict: the trials that differ, with the fraction of the pixels that differ
+            (1 when the image is missing from one of the folders or the sizes differ)
+    '''
+
+    names_a = {p.name for p in Path(dir_a).glob("trial_*.png")}
+    names_b = {p.name for p in Path(dir_b).glob("trial_*.png")}
+
+    diffs = {name: 1.0 for name in names_a ^ names_b}
+    for name in sorted(names_a & names_b):
+        with Image.open(Path(dir_a, name)) as a, Image.open(Path(dir_b, name)) as b:
+            if a.size != b.size:
+                diffs[name] = 1.0
+                continue
+            a = np.asarray(a.convert("RGB"), dtype=np.int16)
+            b = np.asarray(b.convert("RGB"), dtype=np.int16)
+        changed = np.any(np.abs(a - b) > tolerance, axis=2)
+        if changed.any():
+            diffs[name] = float(changed.mean())
+
+    return dict(sorted(diffs.items()))
@@ -0,0 +1,374 @@
+"""
+Run several participant stations from one host.
+
+Each station runs a session function in its own process, with its own window (e.g., on its own screen)
+and optionally pinned to its own CPU core. The stations send their results and their frame timing
+to the controller through a queue, and the controller writes all results into one store:
+
+    def session(win, link, participant):
+        plan = cp.compile_plan("experiment.yaml", cache = "experiment.plan.json")
+        for step in plan.trials:
+            current = plan.build_trial(win, step)
+            current.run()
+            link.report(plan.result(step, current.get_response()))
+
+    controller = stationController("data/lab.journal")
+    controller.add_station("A", session, args = (1,), window = {"screen": 0, "fullscr": True}, core = 2)
+    controller.add_station("B", session, args = (2,), window = {"screen": 1, "fullscr": True}, core = 3)
+    controller.run(on_health = print)
+
+The session function and its arguments are sent to a new interpreter, so the function should be defined
+at the top level of a module (and the script should start the controller under `if __name__ == "__main__":`).
+Sending a result never waits for the controller, so a slow station or a slow disk cannot stall the other stations.
+A station is reported as stalled when it neither flips nor runs a response loop (see `cogpy.heartbeat`);
+session functions with their own loops should call `cogpy.heartbeat.beat()` in them.
+
+A quick check without windows runs a few stations, including a failing one and one that quits:
+
+    python -m cogpy.station --stations 4
+"""
+
+from multiprocessing import get_context
+from queue import Empty
+import argparse
+import math
+import os
+import threading
+import time
+import traceback
+from .journal import sessionJournal
+from . import heartbeat, telemetry
+
+
+class stationLink(object):
+    ''' The connection of a station to its controller, passed to the session function
+
+    Args:
+        name (str): the name of the station.
+        queue (multiprocessing.Queue): the queue to the controller.
+        win (Any): the window of the station, or None.
+    '''
+
+    def __init__(self, name:str, queue, win = None):
+        self.name = name
+        self.queue = queue
+        self.win = win
+        self.seen = 0
+        self.lock = threading.Lock()
+
+    def report(self, result:dict):
+        '''Send a result to the controller
+
+        Args:
+            result (dict): The result, e.g., a trial result. It is stored with the name of the station.
+        '''
+        self.queue.put(("result", self.name, result))
+
+    def send_health(self):
+        '''Send the frame timing since the last call and the heartbeat of the response loops to the controller'''
+
+        with self.lock:
+            new = []
+            if self.win is not None:
+                # take the reported intervals out of the window, so that the list does not grow during the session
+                intervals = self.win.frameIntervals
+                n = len(intervals)
+                new = intervals[:n]
+                del intervals[:n]
+            self.seen += len(new)
+            health = {
+                "time": time.time(),
+                "frames": self.seen,
+                "beats": heartbeat.beats,
+                "mean_interval": sum(new)/len(new) if new else math.nan,
+                "max_interval": max(new) if new else math.nan,
+                "dropped_frames": getattr(self.win, "nDroppedFrames", 0),
+            }
+        self.queue.put(("health", self.name, health))
+
+
+def _station_main(name, target, args, kwargs, window, offscreen, core, queue, health_interval):
+    '''The main function of a station process'''
+
+    win = None
+    link = None
+    stop = threading.Event()
+    try:
+        if core is not None and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, {core})
+        queue.put(("started", name, {"pid": os.getpid(), "core": core}))
+
+        # each station publishes its telemetry under its own name by default
+        telemetry.default_name = f"cogpy-{name}"
+
+        if window is not None:
+            from psychopy import visual
+            settings = {"size": [1600, 900], "color": [1, 1, 1]}
+            if offscreen:
+                # a window that does not wait for the screen, for testing (e.g., in a virtual framebuffer)
+                settings.update({"fullscr": False, "allowGUI": False, "useFBO": True, "waitBlanking": False, "checkTiming": False})
+            settings.update(window)
+            win = visual.Window(**settings)
+            win.recordFrameIntervals = True
+
+        link = stationLink(name, queue, win)
+
+        # report the frame timing from a background thread, so that the controller sees a station that stopped drawing
+        def monitor():
+            while not stop.wait(health_interval):
+                link.send_health()
+        threading.Thread(target=monitor, daemon=True).start()
+
+        target(win, link, *args, **kwargs)
+        stop.set()
+        link.send_health()
+        queue.put(("done", name, None))
+    except (SystemExit, KeyboardInterrupt) as e:
+        # the quit key (core.quit()) ends the session normally
+        stop.set()
+        if isinstance(e, SystemExit) and e.code not in [None, 0]:
+            queue.put(("error", name, f"The session exited with the code {e.code}"))
+        else:
+            if link is not None:
+                link.send_health()
+            queue.put(("done", name, None))
+    except Exception:
+        stop.set()
+        queue.put(("error", name, traceback.format_exc()))
+    finally:
+        if win is not None:
+            win.close()
+
+
+class stationController(object):
+    ''' Launch and monitor participant stations in separate processes
+
+    Args:
+        store (str | sessionJournal | None): the store of the results of all stations, either the path of a journal,
+            a journal (or any object with `append`), or None to keep the results in `results`.
+        health_interval (float, optional): the time between two frame timing reports of a station in seconds. Defaults to 1.
+        stall_timeout (float, optional): the time without a new frame or a new iteration of a response loop
+            after which a running station is reported as stalled (only for stations with a window). Defaults to 5.
+
+    Description:
+        Each result is stored as a dict with the name of the station ("station"). The health of each station
+        contains its state ("starting", "running", "done", "error", or "crashed"), its process and core,
+        the number of results, its frame timing (the number of frames, the mean and maximum frame interval
+        since the last report, and the number of dropped frames), and the number of iterations of its response loops ("beats").
+        A station that quits with the quit key (core.quit()) is "done".
+    '''
+
+    def __init__(self, store = None, health_interval:float = 1, stall_timeout:float = 5):
+
+        self.context = get_context("spawn")
+        self.queue = self.context.Queue()
+        self.health_interval = health_interval
+        self.stall_timeout = stall_timeout
+        self.stations = {}
+        self.processes = {}
+        self.results = []
+        self.errors = {}
+
+        if isinstance(store, (str, os.PathLike)):
+            store = sessionJournal(store)
+        self.store = store
+
+    def add_station(self, name:str, target, args = (), kwargs = None, window = None, offscreen = False, core = None):
+        '''Add a station
+
+        Args:
+            name (str): The name of the station.
+            target (callable): The session function, called as `target(win, link, *args, **kwargs)`,
+                where `link` is a `stationLink` for reporting results.
+            args (tuple, optional): The arguments of the session function. Defaults to ().
+            kwargs (dict, optional): The keyword arguments of the session function. Defaults to None.
+            window (dict, optional): The arguments of the psychopy window (e.g., {"screen": 1, "fullscr": True}).
+                Defaults to None (no window, e.g., for testing the session logic).
+            offscreen (bool, optional): Whether to open a window that does not wait for the screen, for testing. Defaults to False.
+            core (int, optional): The CPU core of the station process (on Linux). Defaults to None (no pinning).
+        '''
+
+        if name in self.stations:
+            raise ValueError(f"The station {name} already exists")
+        if core is not None and hasattr(os, "sched_getaffinity") and core not in os.sched_getaffinity(0):
+            raise ValueError(f"The core {core} is not available")
+
+        self.stations[name] = {
+            "state": "starting", "pid": None, "core": core, "results": 0, "frames": 0, "beats": 0,
+            "mean_interval": math.nan, "max_interval": math.nan, "dropped_frames": 0,
+            "last_report": None, "last_active": None, "stalled": False, "window": window is not None,
+        }
+        self.processes[name] = self.context.Process(
+            target=_station_main, name=f"station-{name}", daemon=True,
+            args=(name, target, tuple(args), kwargs or {}, window, offscreen, core, self.queue, self.health_interval))
+
+    def start(self):
+        '''Start the stations that are not started'''
+
+        for name, process in self.processes.items():
+            if process.pid is None:
+                process.start()
+                self.stations[name]["pid"] = process.pid
+
+    def poll(self, timeout:float = 0):
+        '''Store the messages of the stations
+
+        Args:
+            timeout (float, optional): The time to wait for the first message in seconds. Defaults to 0.
+
+        Returns:
+            int: the number of messages
+        '''
+
+        count = 0
+        while True:
+            try:
+                kind, name, value = self.queue.get(timeout=timeout) if count == 0 and timeout > 0 else self.queue.get_nowait()
+            except Empty:
+                break
+            count += 1
+            self.__handle(kind, name, value)
+
+        self.__check()
+        return count
+
+    def __handle(self, kind, name, value):
+
+        station = self.stations[name]
+        if kind == "started":
+            station.update(value)
+            station["state"] = "running"
+            station["last_active"] = time.monotonic()
+        elif kind == "result":
+            record = {"station": name, **value}
+            self.results.append(record)
+            if self.store is not None:
+                self.store.append(record)
+            station["results"] += 1
+        elif kind == "health":
+            # a new frame, or a response loop that polls without flipping
+            if value["frames"] > station["frames"] or value["beats"] > station["beats"]:
+                station["last_active"] = time.monotonic()
+            station.update({k: v for k, v in value.items() if k != "time"})
+            station["last_report"] = value["time"]
+        elif kind == "done":
+            station["state"] = "done"
+        elif kind == "error":
+            station["state"] = "error"
+            self.errors[name] = value
+
+    def __check(self):
+        '''Detect crashed and stalled stations'''
+
+        now = time.monotonic()
+        for name, station in self.stations.items():
+            process = self.processes[name]
+            if station["state"] in ["starting", "running"] and process.exitcode is not None and self.queue.empty():
+                station["state"] = "crashed"
+            station["stalled"] = (
+                station["state"] == "running" and station["window"] and station["last_report"] is not None
+                and station["last_active"] is not None and now - station["last_active"] > self.stall_timeout)
+
+    def health(self):
+        '''The health of the stations
+
+        Returns:
+            dict: the state, the number of results, and the frame timing of each station
+        '''
+        return {name: dict(station) for name, station in self.stations.items()}
+
+    def running(self):
+        '''Whether a station is still running'''
+        return any(station["state"] in ["starting", "running"] for station in self.stations.values())
+
+    def run(self, interval:float = 0.5, on_health = None):
+        '''Start the stations and store their results until all stations are finished
+
+        Args:
+            interval (float, optional): The time between two health updates in seconds. Defaults to 0.5.
+            on_health (callable, optional): A function that is called with `health()` after each update. Defaults to None.
+
+        Returns:
+            dict: the health of the stations at the end
+        '''
+
+        self.start()
+        try:
+            while self.running():
+                deadline = time.monotonic() + interval
+                while time.monotonic() < deadline:
+                    self.poll(timeout=max(0.001, deadline - time.monotonic()))
+                if on_health is not None:
+                    on_health(self.health())
+            self.poll()
+        finally:
+            self.join(timeout=5)
+        return self.health()
+
+    def join(self, timeout:float = None):
+        '''Wait for the station processes to exit, and sync the store'''
+
+        for process in self.processes.values():
+            if process.pid is not None:
+                process.join(timeout)
+        if self.store is not None and hasattr(self.store, "sync"):
+            self.store.sync()
+
+    def stop(self):
+        '''Terminate the stations and close the store'''
+
+        for name, process in self.processes.items():
+            if process.is_alive():
+                process.terminate()
+                self.stations[name]["state"] = "crashed"
+        self.join(timeout=5)
+        self.poll()
+        if self.store is not None and hasattr(self.store, "close"):
+            self.store.close()
+
+
+def _check_session(win, link, kind, n):
+    '''A session without a window for the self-check: "normal" reports n results, "wait" also polls a response loop,
+    "fail" raises an error, and "quit" exits like the quit key'''
+
+    for i in range(n):
+        if kind == "fail" and i == n//2:
+            raise RuntimeError("a failing station")
+        if kind == "quit" and i == n//2:
+            raise SystemExit(0)
+        deadline = time.monotonic() + 0.05
+        while time.monotonic() < deadline:
+            if kind == "wait":
+                heartbeat.beat()
+            time.sleep(0.001)
+        link.report({"trial_index": i, "kind": kind})
+
+
+def main(argv = None):
+    '''Run stations without windows and check their results and states'''
+
+    parser = argparse.ArgumentParser(description="Check the station controller with stations without windows")
+    parser.add_argument("--stations", type=int, default=4, help="the number of stations")
+    parser.add_argument("-n", type=int, default=20, help="the number of results of each station")
+    args = parser.parse_args(argv)
+
+    kinds = ["normal", "wait", "fail", "quit"]
+    expected = {"normal": ("done", args.n), "wait": ("done", args.n), "fail": ("error", args.n//2), "quit": ("done", args.n//2)}
+
+    controller = stationController(None, health_interval = 0.2)
+    for i in range(args.stations):
+        controller.add_station(f"S{i+1}", _check_session, args = (kinds[i % len(kinds)], args.n))
+    health = controller.run(interval = 0.2)
+
+    ok = True
+    for i, (name, station) in enumerate(health.items()):
+        kind = kinds[i % len(kinds)]
+        state, results = expected[kind]
+        passed = station["state"] == state and station["results"] == results
+        ok = ok and passed
+        print(f"{name:<6}{kind:<8}{station['state']:<8}{station['results']:>5} results  {'ok' if passed else 'FAILED'}")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
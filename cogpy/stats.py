@@ -0,0 +1,417 @@
+"""
+Online statistics and adaptive procedures for trial results.
+
+Each trial result updates the statistics in constant time, so summaries and staircases
+are available after every trial without going back over the previous trials:
+
+    stats = conditionStats("condition", correct = lambda r: r["response"] == [r["answer"]],
+                           controllers = {"hard": staircase(start = 0.5, step = 0.05)})
+    for ...:
+        current.run()
+        stats.update(plan.result(step, current.get_response()))
+        contrast = stats.controllers["hard"].value
+"""
+
+import math
+import numpy as np
+
+
+class p2Quantile(object):
+    ''' A running estimate of a quantile with the P² algorithm (Jain & Chlamtac, 1985)
+
+    Args:
+        p (float): The quantile, between 0 and 1 (e.g., 0.5 for the median).
+
+    Description:
+        The estimate uses five markers whose heights are adjusted with a piecewise-parabolic formula,
+        so each update takes constant time and memory.
+    '''
+
+    def __init__(self, p:float):
+
+        if not 0 < p < 1:
+            raise ValueError("The quantile should be between 0 and 1")
+        self.p = p
+        self.count = 0
+        self.q = [] # the marker heights
+        self.n = [0, 1, 2, 3, 4] # the marker positions
+        self.desired = [0, 2*p, 4*p, 2 + 2*p, 4]
+        self.increments = [0, p/2, p, (1 + p)/2, 1]
+
+    def update(self, x:float):
+        '''Add an observation'''
+
+        q, n = self.q, self.n
+        self.count += 1
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # the cell of the observation
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k+1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # adjust the middle markers
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolic = q[i] + d/(n[i+1] - n[i-1])*(
+                    (n[i] - n[i-1] + d)*(q[i+1] - q[i])/(n[i+1] - n[i]) +
+                    (n[i+1] - n[i] - d)*(q[i] - q[i-1])/(n[i] - n[i-1]))
+                if q[i-1] < parabolic < q[i+1]:
+                    q[i] = parabolic
+                else:
+                    q[i] = q[i] + d*(q[i+d] - q[i])/(n[i+d] - n[i])
+                n[i] += d
+
+    @property
+    def value(self):
+        '''The estimate of the quantile (NaN without observations)'''
+
+        if self.count == 0:
+            return math.nan
+        if self.count <= 5:
+            # the markers are the sorted observations until the first adjustment
+            return float(np.quantile(self.q, self.p))
+        return self.q[2]
+
+
+class runningStats(object):
+    ''' Running mean, variance, extremes, and quantiles of a stream of values
+
+    Args:
+        quantiles (list, optional): The quantiles that are estimated with `p2Quantile`. Defaults to [0.5].
+
+    Description:
+        The mean and the variance are updated with Welford's algorithm, which is numerically stable.
+    '''
+
+    def __init__(self, quantiles = (0.5,)):
+
+        self.count = 0
+        self.mean = math.nan
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.quantiles = {p: p2Quantile(p) for p in quantiles}
+
+    def update(self, x:float):
+        '''Add a value'''
+
+        x = float(x)
+        self.count += 1
+        if self.count == 1:
+            self.mean = x
+        else:
+            delta = x - self.mean
+            self.mean += delta/self.count
+            self.m2 += delta*(x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        for quantile in self.quantiles.values():
+            quantile.update(x)
+
+    @property
+    def var(self):
+        '''The sample variance (NaN with less than two values)'''
+        return self.m2/(self.count - 1) if self.count > 1 else math.nan
+
+    @property
+    def sd(self):
+        '''The sample standard deviation'''
+        return math.sqrt(self.var) if self.count > 1 else math.nan
+
+    def quantile(self, p:float):
+        '''The estimate of a quantile that was given to the constructor'''
+        return self.quantiles[p].value
+
+
+class conditionStats(object):
+    ''' Running accuracy and RT statistics of the trial results of each condition
+
+    Args:
+        condition (str | callable, optional): The condition of a result, either a key of the result dict
+            or a function of the result. Defaults to "condition".
+        rt (str, optional): The key of the RT in the results. Defaults to "rt".
+        correct (str | callable, optional): Whether a result is correct, either a key of the result dict
+            or a function of the result. Results without a correctness (None) are not scored. Defaults to "correct".
+        quantiles (list, optional): The RT quantiles that are estimated. Defaults to [0.5, 0.9].
+        controllers (dict, optional): Adaptive procedures (e.g., `staircase`) by condition.
+            Each scored result of a condition updates its controller. Defaults to None.
+    '''
+
+    def __init__(self, condition = "condition", rt = "rt", correct = "correct", quantiles = (0.5, 0.9), controllers = None):
+
+        self.condition = condition
+        self.rt = rt
+        self.correct = correct
+        self.quantiles = quantiles
+        self.controllers = {} if controllers is None else controllers
+        self.rts = {}
+        self.trials = {}
+        self.scored = {}
+        self.hits = {}
+
+    def __get(self, result, key):
+        if callable(key):
+            return key(result)
+        return result.get(key)
+
+    def update(self, result:dict):
+        '''Add a trial result
+
+        Args:
+            result (dict): The result, e.g., from `trial.get_response()` or `experimentPlan.result()` with the data of the trial.
+
+        Returns:
+            Any: the condition of the result
+        '''
+
+        condition = self.__get(result, self.condition)
+        if condition not in self.trials:
+            self.rts[condition] = runningStats(self.quantiles)
+            self.trials[condition] = 0
+            self.scored[condition] = 0
+            self.hits[condition] = 0
+
+        self.trials[condition] += 1
+        rt = result.get(self.rt)
+        if rt is not None:
+            self.rts[condition].update(rt)
+
+        correct = self.__get(result, self.correct)
+        if correct is not None:
+            self.scored[condition] += 1
+            self.hits[condition] += bool(correct)
+            if condition in self.controllers:
+                self.controllers[condition].update(bool(correct))
+
+        return condition
+
+    def accuracy(self, condition):
+        '''The proportion of correct results of a condition (NaN without scored results)'''
+        return self.hits[condition]/self.scored[condition] if self.scored.get(condition) else math.nan
+
+    def summary(self, condition = None):
+        '''Summarize the results
+
+        Args:
+            condition (Any, optional): The condition. Defaults to None (all conditions).
+
+        Returns:
+            dict: the number of trials, the accuracy, and the RT mean, SD, and quantiles (e.g., "rt_q50"),
+                of the condition, or of each condition by condition
+        '''
+
+        if condition is None:
+            return {c: self.summary(c) for c in self.trials}
+
+        rts = self.rts[condition]
+        summary = {
+            "trials": self.trials[condition],
+            "accuracy": self.accuracy(condition),
+            "rt_mean": rts.mean,
+            "rt_sd": rts.sd,
+        }
+        for p in self.quantiles:
+            summary[f"rt_q{round(p*100)}"] = rts.quantile(p)
+        if condition in self.controllers:
+            summary["value"] = self.controllers[condition].value
+        return summary
+
+
+class staircase(object):
+    ''' A transformed up-down staircase (Levitt, 1971)
+
+    Args:
+        start (float): The starting value (e.g., a contrast).
+        step (float): The step size after `n_down` correct responses in a row.
+        n_up (int, optional): The number of incorrect responses in a row before the value increases. Defaults to 1.
+        n_down (int, optional): The number of correct responses in a row before the value decreases. Defaults to 3.
+        step_up (float, optional): The step size after `n_up` incorrect responses. Defaults to `step`.
+            Unequal steps give a weighted up-down staircase (Kaernbach, 1991).
+        min_value (float, optional): The minimum value. Defaults to None.
+        max_value (float, optional): The maximum value. Defaults to None.
+        max_reversals (int, optional): The number of reversals after which the staircase is finished. Defaults to None.
+        max_trials (int, optional): The number of trials after which the staircase is finished. Defaults to None.
+
+    Description:
+        Correct responses make the task harder by decreasing the value. The 1-up 3-down rule
+        converges to about 79% correct.
+    '''
+
+    def __init__(self, start:float, step:float, n_up:int = 1, n_down:int = 3, step_up:float = None,
+                 min_value:float = None, max_value:float = None, max_reversals:int = None, max_trials:int = None):
+
+        self.value = start
+        self.step_down = step
+        self.step_up = step if step_up is None else step_up
+        self.n_up = n_up
+        self.n_down = n_down
+        self.min_value = min_value
+        self.max_value = max_value
+        self.max_reversals = max_reversals
+        self.max_trials = max_trials
+        self.trials = 0
+        self.run = 0 # positive for correct responses in a row, negative for incorrect ones
+        self.direction = 0
+        self.reversals = []
+
+    def update(self, correct:bool):
+        '''Update the value after a response
+
+        Args:
+            correct (bool): Whether the response was correct.
+
+        Returns:
+            float: the next value
+        '''
+
+        self.trials += 1
+        if correct:
+            self.run = self.run + 1 if self.run > 0 else 1
+            if self.run >= self.n_down:
+                self.__move(-1)
+        else:
+            self.run = self.run - 1 if self.run < 0 else -1
+            if -self.run >= self.n_up:
+                self.__move(1)
+        return self.value
+
+    def __move(self, direction:int):
+
+        if self.direction != 0 and direction != self.direction:
+            self.reversals.append(self.value)
+        self.direction = direction
+        self.run = 0
+
+        value = self.value + (self.step_up if direction > 0 else -self.step_down)
+        if self.min_value is not None:
+            value = max(value, self.min_value)
+        if self.max_value is not None:
+            value = min(value, self.max_value)
+        self.value = value
+
+    @property
+    def finished(self):
+        '''Whether the staircase reached its maximum number of reversals or trials'''
+
+        return (self.max_reversals is not None and len(self.reversals) >= self.max_reversals) or \
+               (self.max_trials is not None and self.trials >= self.max_trials)
+
+    def threshold(self, last:int = 6):
+        '''The threshold, as the mean of the values at the last reversals
+
+        Args:
+            last (int, optional): The number of reversals. Defaults to 6.
+        '''
+
+        if len(self.reversals) == 0:
+            return math.nan
+        return float(np.mean(self.reversals[-last:]))
+
+
+class questStaircase(object):
+    ''' A QUEST staircase (Watson & Pelli, 1983), with a posterior over the threshold on a grid
+
+    Args:
+        guess (float): The prior guess of the threshold, in the units of the values (usually log units, e.g., log10 contrast).
+        guess_sd (float): The standard deviation of the prior.
+        p_threshold (float, optional): The proportion correct at the threshold. Defaults to 0.82.
+        beta (float, optional): The slope of the Weibull psychometric function. Defaults to 3.5.
+        delta (float, optional): The lapse rate. Defaults to 0.01.
+        gamma (float, optional): The guess rate (e.g., 0.5 in a 2AFC task). Defaults to 0.5.
+        grain (float, optional): The spacing of the grid. Defaults to 0.01.
+        width (float, optional): The width of the grid around the guess. Defaults to 5 standard deviations on each side.
+        min_value (float, optional): The minimum value. Defaults to None.
+        max_value (float, optional): The maximum value. Defaults to None.
+        max_trials (int, optional): The number of trials after which the staircase is finished. Defaults to None.
+
+    Description:
+        Each update multiplies the posterior by the likelihood of the response on the grid,
+        so its cost depends on the size of the grid but not on the number of trials.
+        The next value is the mean of the posterior.
+    '''
+
+    def __init__(self, guess:float, guess_sd:float, p_threshold:float = 0.82, beta:float = 3.5, delta:float = 0.01, gamma:float = 0.5,
+                 grain:float = 0.01, width:float = None, min_value:float = None, max_value:float = None, max_trials:int = None):
+
+        width = 10*guess_sd if width is None else width
+        self.grid = guess + np.arange(-width/2, width/2 + grain/2, grain)
+        self.log_posterior = -0.5*((self.grid - guess)/guess_sd)**2
+        self.beta = beta
+        self.delta = delta
+        self.gamma = gamma
+        self.min_value = min_value
+        self.max_value = max_value
+        self.max_trials = max_trials
+        self.trials = 0
+
+        # the offset that puts p_threshold at the threshold
+        self.offset = math.log10(-math.log((1 - delta - p_threshold + delta*gamma)/((1 - delta)*(1 - gamma))))/beta
+        self.value = self.__next()
+
+    def p_correct(self, x):
+        '''The probability of a correct response at the values x, for each threshold of the grid'''
+
+        return self.delta*self.gamma + (1 - self.delta)*(1 - (1 - self.gamma)*np.exp(-10**(self.beta*(x - self.grid + self.offset))))
+
+    def update(self, correct:bool, value:float = None):
+        '''Update the posterior after a response
+
+        Args:
+            correct (bool): Whether the response was correct.
+            value (float, optional): The value that was presented. Defaults to the current value.
+
+        Returns:
+            float: the next value
+        '''
+
+        value = self.value if value is None else value
+        p = self.p_correct(value)
+        self.log_posterior += np.log(p if correct else 1 - p)
+        self.log_posterior -= self.log_posterior.max()
+        self.trials += 1
+        self.value = self.__next()
+        return self.value
+
+    def __posterior(self):
+        posterior = np.exp(self.log_posterior)
+        return posterior/posterior.sum()
+
+    def __next(self):
+        value = float(self.__posterior() @ self.grid)
+        if self.min_value is not None:
+            value = max(value, self.min_value)
+        if self.max_value is not None:
+            value = min(value, self.max_value)
+        return value
+
+    @property
+    def finished(self):
+        '''Whether the staircase reached its maximum number of trials'''
+        return self.max_trials is not None and self.trials >= self.max_trials
+
+    def threshold(self):
+        '''The mean of the posterior of the threshold'''
+        return float(self.__posterior() @ self.grid)
+
+    def sd(self):
+        '''The standard deviation of the posterior of the threshold'''
+        posterior = self.__posterior()
+        mean = posterior @ self.grid
+        return float(np.sqrt(posterior @ (self.grid - mean)**2))
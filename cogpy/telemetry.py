@@ -0,0 +1,226 @@
+"""
+Live session telemetry through shared memory.
+
+The experiment process publishes its state into a ring buffer in shared memory with `sessionTelemetry`,
+and a monitor process reads it with `telemetryReader` or the command line reader:
+
+    python -m cogpy.telemetry cogpy
+
+Publishing only writes a few numbers into shared memory, so it never waits for the monitor or the terminal.
+Each slot of the ring is protected by a sequence number (a seqlock): the reader retries a slot
+that was being written while it was read, so neither side ever takes a lock.
+"""
+
+from multiprocessing import shared_memory, resource_tracker
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+record_dtype = np.dtype([
+    ("seq", np.uint64),
+    ("time", np.float64),
+    ("trial_index", np.int64),
+    ("rt", np.float64),
+    ("dropped_frames", np.int64),
+    ("poll_rate", np.float64),
+])
+header_dtype = np.dtype([("count", np.uint64), ("capacity", np.uint64), ("pid", np.int64)])
+
+# the default name of the telemetry block (a station of a `stationController` uses "cogpy-{station}")
+default_name = "cogpy"
+
+
+def _alive(pid:int):
+    '''Whether a process is running'''
+
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _views(buf, capacity):
+    header = np.ndarray((1,), dtype=header_dtype, buffer=buf)
+    ring = np.ndarray((capacity,), dtype=record_dtype, buffer=buf, offset=header_dtype.itemsize)
+    return header, ring
+
+
+class sessionTelemetry(object):
+    ''' Publish the state of a session into shared memory
+
+    Args:
+        name (str, optional): the name of the shared memory block. Defaults to None ("cogpy",
+            or "cogpy-{station}" in a station of a `stationController`).
+        capacity (int, optional): the number of records kept in the ring. Defaults to 1024.
+
+    Raises:
+        FileExistsError: another running session publishes under the same name.
+
+    Description:
+        Each record contains the time (from time.time()), the trial index, the last RT,
+        the number of dropped frames, and the poll rate of the response loop (iterations per second).
+        Values that are not known are NaN (or -1 for the counts).
+        A block with the same name is only replaced when the session that created it is no longer running.
+    '''
+
+    def __init__(self, name:str = None, capacity:int = 1024):
+
+        name = default_name if name is None else name
+        self.name = name
+        self.capacity = capacity
+        size = header_dtype.itemsize + capacity*record_dtype.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            old = shared_memory.SharedMemory(name=name)
+            pid = int(np.ndarray((1,), dtype=header_dtype, buffer=old.buf)["pid"][0]) if old.size >= header_dtype.itemsize else -1
+            if _alive(pid):
+                old.close()
+                raise FileExistsError(f"The telemetry block {name} is used by the running process {pid}, choose another name")
+            # a block left by a crashed session
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self.header, self.ring = _views(self.shm.buf, capacity)
+        self.ring[:] = 0
+        self.header["capacity"] = capacity
+        self.header["count"] = 0
+        self.header["pid"] = os.getpid()
+        self.count = 0
+
+    def publish(self, trial_index = -1, rt = None, dropped_frames = -1, poll_rate = None):
+        '''Publish the current state of the session
+
+        Args:
+            trial_index (int, optional): The index of the current trial. Defaults to -1.
+            rt (float, optional): The RT of the last trial. Defaults to None.
+            dropped_frames (int, optional): The number of dropped frames. Defaults to -1.
+            poll_rate (float, optional): The poll rate of the response loop. Defaults to None.
+        '''
+
+        slot = self.ring[self.count % self.capacity]
+        seq = 2*self.count + 1
+
+        # odd while the slot is written, even when it is complete
+        slot["seq"] = seq
+        slot["time"] = time.time()
+        slot["trial_index"] = trial_index
+        slot["rt"] = np.nan if rt is None else rt
+        slot["dropped_frames"] = -1 if dropped_frames is None else dropped_frames
+        slot["poll_rate"] = np.nan if poll_rate is None else poll_rate
+        slot["seq"] = seq + 1
+
+        self.count += 1
+        self.header["count"] = self.count
+
+    def close(self):
+        '''Close and remove the shared memory block'''
+
+        del self.header, self.ring
+        self.shm.close()
+        self.shm.unlink()
+
+
+class telemetryReader(object):
+    ''' Read the state of a session from shared memory, from another process
+
+    Args:
+        name (str, optional): the name of the shared memory block. Defaults to "cogpy".
+    '''
+
+    def __init__(self, name:str = "cogpy"):
+
+        # the block belongs to the experiment process, so the reader should not remove it at exit
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        capacity = int(np.ndarray((1,), dtype=header_dtype, buffer=self.shm.buf)["capacity"][0])
+        self.header, self.ring = _views(self.shm.buf, capacity)
+        self.capacity = capacity
+        self.next = 0
+
+    def __read(self, n:int):
+        '''Read record n, or None if it was overwritten'''
+
+        slot = self.ring[n % self.capacity]
+        for _ in range(100):
+            before = int(slot["seq"])
+            record = slot.copy()
+            if before % 2 == 0 and int(slot["seq"]) == before:
+                return record if before == 2*n + 2 else None
+        return None
+
+    def latest(self):
+        '''The latest record, as a dict, or None if nothing was published'''
+
+        count = int(self.header["count"][0])
+        if count == 0:
+            return None
+        record = self.__read(count - 1)
+        return None if record is None else {name: record[name].item() for name in record_dtype.names if name != "seq"}
+
+    def read_new(self):
+        '''The records published since the last call, as a list of dicts'''
+
+        count = int(self.header["count"][0])
+        start = max(self.next, count - self.capacity)
+        records = []
+        for n in range(start, count):
+            record = self.__read(n)
+            if record is not None:
+                records.append({name: record[name].item() for name in record_dtype.names if name != "seq"})
+        self.next = count
+        return records
+
+    def close(self):
+        del self.header, self.ring
+        self.shm.close()
+
+
+def main(argv = None):
+    '''A command line reader that prints the latest state of a session'''
+
+    parser = argparse.ArgumentParser(description="Monitor a running cogpy session")
+    parser.add_argument("name", nargs="?", default="cogpy", help="the name of the telemetry block")
+    parser.add_argument("--interval", type=float, default=0.5, help="the time between two updates in seconds")
+    args = parser.parse_args(argv)
+
+    reader = None
+    try:
+        while reader is None:
+            try:
+                reader = telemetryReader(args.name)
+            except FileNotFoundError:
+                print(f"Waiting for session {args.name}...", end="\r", flush=True)
+                time.sleep(args.interval)
+
+        while True:
+            state = reader.latest()
+            if state is not None:
+                age = time.time() - state["time"]
+                print(
+                    f"trial {state['trial_index']:>5} | "
+                    f"last RT {state['rt']:7.3f} s | "
+                    f"dropped frames {state['dropped_frames']:>4} | "
+                    f"poll rate {state['poll_rate']:9.0f} Hz | "
+                    f"updated {age:5.1f} s ago", end="\r", flush=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        if reader is not None:
+            reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Procedural textures for stimBoxes. Each generator creates the textures of all boxes in one vectorized batch.
+
+All generators take the texture resolution `res` (pixels) and the number of textures `n`,
+followed by per-texture parameters as arrays of length n. They return a tuple of
+the images (n, res, res) or (n, res, res, 3) and the masks (n, res, res) or None,
+with values between -1 and 1 as expected by psychopy.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import sys
+import numpy as np
+
+
+def _grid(res):
+    '''The pixel coordinates of a texture, between -0.5 and 0.5, as (1, res, res) arrays
+
+    psychopy draws the first row of an array texture at the bottom, so y increases with the row.
+    '''
+    coords = (np.arange(res) + 0.5)/res - 0.5
+    x, y = np.meshgrid(coords, coords)
+    return x[None], y[None]
+
+
+def _rotated(res, ori):
+    '''The pixel coordinates rotated by the orientations (in degrees, clockwise)'''
+    x, y = _grid(res)
+    theta = np.deg2rad(np.asarray(ori, dtype=float))[:, None, None]
+    xr = x*np.cos(theta) - y*np.sin(theta)
+    yr = x*np.sin(theta) + y*np.cos(theta)
+    return xr, yr
+
+
+def gabor(res, n, ori=0, sf=5, phase=0, sigma=0.15, contrast=1, color=None):
+    '''Gabor patches
+
+    Args:
+        res (int): The resolution of the textures in pixels.
+        n (int): The number of textures.
+        ori (float|array, optional): The orientation in degrees. Defaults to 0 (vertical stripes).
+        sf (float|array, optional): The spatial frequency in cycles per texture width. Defaults to 5.
+        phase (float|array, optional): The phase in degrees. Defaults to 0.
+        sigma (float|array, optional): The standard deviation of the Gaussian envelope,
+            relative to the texture width. Defaults to 0.15.
+        contrast (float|array, optional): The contrast between 0 and 1. Defaults to 1.
+        color (array, optional): The RGB colors between -1 and 1, either one color or one per texture.
+            The grating then goes from -color to color. Defaults to None (grayscale).
+    '''
+
+    ori, sf, phase, sigma, contrast = [np.broadcast_to(p, (n,)).astype(float) for p in (ori, sf, phase, sigma, contrast)]
+    xr, _ = _rotated(res, ori)
+    x, y = _grid(res)
+
+    image = np.cos(2*np.pi*sf[:, None, None]*xr + np.deg2rad(phase)[:, None, None])*contrast[:, None, None]
+    envelope = np.exp(-(x**2 + y**2)/(2*sigma[:, None, None]**2))
+    if color is not None:
+        color = np.broadcast_to(np.asarray(color, dtype=float), (n, 3))
+        image = image[..., None]*color[:, None, None, :]
+    return image, envelope*2 - 1
+
+
+def square(res, n, color=[1, 1, 1]):
+    '''Uniformly colored squares
+
+    Args:
+        res (int): The resolution of the textures in pixels.
+        n (int): The number of textures.
+        color (array, optional): The RGB colors between -1 and 1, either one color or one per texture.
+            Defaults to [1, 1, 1].
+    '''
+
+    color = np.broadcast_to(np.asarray(color, dtype=float), (n, 3))
+    image = np.broadcast_to(color[:, None, None, :], (n, res, res, 3)).copy()
+    return image, None
+
+
+def bar(res, n, ori=0, length=0.8, thickness=0.15, color=[-1, -1, -1]):
+    '''Oriented bars
+
+    Args:
+        res (int): The resolution of the textures in pixels.
+        n (int): The number of textures.
+        ori (float|array, optional): The orientation in degrees. Defaults to 0 (vertical bar).
+        length (float|array, optional): The length relative to the texture width. Defaults to 0.8.
+        thickness (float|array, optional): The thickness relative to the texture width. Defaults to 0.15.
+        color (array, optional): The RGB colors between -1 and 1, either one color or one per texture.
+            Defaults to [-1, -1, -1].
+    '''
+
+    ori, length, thickness = [np.broadcast_to(p, (n,)).astype(float) for p in (ori, length, thickness)]
+    xr, yr = _rotated(res, ori)
+    inside = (np.abs(xr) <= thickness[:, None, None]/2) & (np.abs(yr) <= length[:, None, None]/2)
+    image, _ = square(res, n, color)
+    return image, np.where(inside, 1.0, -1.0)
+
+
+def _noise_chunk(res, seeds, spectrum):
+    '''Generate a chunk of noise fields, one per seed (runs in a worker process)'''
+
+    white = np.stack([np.random.default_rng(seed).standard_normal((res, res)) for seed in seeds])
+    if spectrum == "white":
+        field = white
+    elif spectrum == "pink":
+        # 1/f amplitude spectrum
+        fx = np.fft.fftfreq(res)
+        f = np.sqrt(fx[None, :]**2 + fx[:, None]**2)
+        f[0, 0] = np.inf
+        field = np.fft.ifft2(np.fft.fft2(white)/f).real
+    else:
+        raise ValueError("The noise type should be either white or pink")
+    # scale each field to -1 and 1
+    field -= field.min(axis=(1, 2), keepdims=True)
+    field /= field.max(axis=(1, 2), keepdims=True)
+    return field*2 - 1
+
+
+def noise(res, n, spectrum="white", seed=None, workers=None):
+    '''Noise masks
+
+    Args:
+        res (int): The resolution of the textures in pixels.
+        n (int): The number of textures.
+        spectrum (str, optional): The spectrum of the noise, either "white" or "pink". Defaults to "white".
+        seed (int, optional): The random seed. Defaults to None.
+        workers (int, optional): The number of worker processes.
+            Large noise fields are generated in parallel when more than one worker is used. Defaults to None (no pool).
+            The fields only depend on the seed, not on the number of workers.
+    '''
+
+    # each field has its own random stream, so the fields do not depend on how they are split
+    seeds = np.random.SeedSequence(seed).spawn(n)
+    if workers is None or workers <= 1 or n < 2:
+        return _noise_chunk(res, seeds, spectrum), None
+
+    # split the fields across the workers
+    chunks = [list(c) for c in np.array_split(np.array(seeds, dtype=object), min(workers, n))]
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        fields = pool.map(_noise_chunk, [res]*len(chunks), chunks, [spectrum]*len(chunks))
+        return np.concatenate(list(fields)), None
+
+
+generators = {
+    "gabor": gabor,
+    "square": square,
+    "bar": bar,
+    "noise": noise,
+}
+
+
+class textureCache(object):
+    ''' A memo of generated textures, keyed by the generator, the resolution and the parameters of each texture
+
+    Args:
+        maxbytes (int, optional): The maximum size of the cached textures and masks in bytes. Defaults to 256 MB.
+
+    Description:
+        Each texture is stored as its own float32 copy, so a cached texture does not keep the rest of its batch in memory.
+        The least recently used textures are dropped first.
+    '''
+
+    def __init__(self, maxbytes = 256*2**20):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self.items = OrderedDict()
+
+    def generate(self, kind:str, res:int, n:int, workers=None, **params):
+        '''Generate a batch of textures, reusing the cached ones
+
+        Args:
+            kind (str): The name of the generator, one of "gabor", "square", "bar", or "noise".
+            res (int): The resolution of the textures in pixels.
+            n (int): The number of textures.
+            workers (int, optional): The number of worker processes for noise masks. Defaults to None.
+            **params: The parameters of the generator. Each parameter is either a single value or one value per texture.
+
+        Returns:
+            list: the (image, mask) of each texture
+        '''
+
+        if kind not in generators:
+            raise ValueError(f"The texture should be one of {', '.join(generators)}")
+
+        # noise masks are random, so they are not memoized
+        if kind == "noise":
+            image, _ = noise(res, n, workers=workers, **params)
+            return [(image[i], None) for i in range(n)]
+
+        # the parameters of each texture (colors have three values per texture)
+        per_item = {}
+        for name, value in params.items():
+            shape = (n, 3) if name == "color" else (n,)
+            per_item[name] = np.broadcast_to(np.asarray(value, dtype=float), shape)
+        keys = [(kind, res) + tuple((name, per_item[name][i].tobytes()) for name in sorted(per_item)) for i in range(n)]
+
+        # reuse the cached textures
+        results = [self.items.get(key) for key in keys]
+        for key in keys:
+            if key in self.items: self.items.move_to_end(key)
+
+        # generate the missing textures in one batch
+        missing = [i for i in range(n) if results[i] is None]
+        if len(missing) > 0:
+            image, mask = generators[kind](res, len(missing), **{name: value[missing] for name, value in per_item.items()})
+            for j, i in enumerate(missing):
+                results[i] = (image[j].astype(np.float32), None if mask is None else mask[j].astype(np.float32))
+                self.__store(keys[i], results[i])
+
+        return results
+
+    def __store(self, key, item):
+        '''Add a texture and drop the least recently used ones above the size limit'''
+
+        size = sum(a.nbytes for a in item if a is not None)
+        if size > self.maxbytes:
+            return
+        if key in self.items:
+            self.nbytes -= sum(a.nbytes for a in self.items.pop(key) if a is not None)
+        self.items[key] = item
+        self.nbytes += size
+        while self.nbytes > self.maxbytes:
+            _, old = self.items.popitem(last=False)
+            self.nbytes -= sum(a.nbytes for a in old if a is not None)
+
+    def clear(self):
+        '''Remove all textures'''
+        self.items.clear()
+        self.nbytes = 0
+
+
+cache = textureCache()
+
+
+def _tilt(texture):
+    '''The side to which a texture leans, as drawn by psychopy (1: right, -1: left)'''
+
+    # psychopy draws the first row at the bottom, so the main diagonal goes from the bottom left to the top right
+    return np.sign(np.diagonal(texture).mean() - np.diagonal(texture[::-1]).mean())
+
+
+def main():
+    '''Check that the orientations of the textures turn clockwise, as the orientations of psychopy,
+    and that noise masks only depend on their seed'''
+
+    res = 64
+    checks = {
+        "gabor": gabor(res, 1, ori=45)[0][0],
+        "bar": bar(res, 1, ori=45)[1][0], # the mask is 1 on the bar
+    }
+    failed = False
+    for name, texture in checks.items():
+        ok = _tilt(texture) == 1
+        failed = failed or not ok
+        print(f"{name:6} ori=45 leans {'right' if ok else 'left'}  {'ok' if ok else 'FAILED'}")
+
+    single, _ = noise(res, 6, seed=1)
+    for workers in [2, 4]:
+        ok = np.array_equal(single, noise(res, 6, seed=1, workers=workers)[0])
+        failed = failed or not ok
+        print(f"noise  seed=1 workers={workers} matches workers=None  {'ok' if ok else 'FAILED'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import numpy as np
+
+
+class mouseTracker(object):
+    ''' Record the mouse position and button state into a preallocated ring buffer
+
+    Args:
+        mouse (object): the mouse object from psychopy
+        period (float): the time between two samples in seconds.
+            Use the frame period of the window to sample once per frame.
+        capacity (int, optional): the number of samples kept in the buffer.
+            When the buffer is full, the oldest samples are overwritten. Defaults to 10000.
+        threshold (float, optional): the distance from the start position that counts as movement,
+            in the units of the window. Defaults to 0.01.
+
+    Description:
+        Each sample is a row of [time, x, y, pressed], where the time is relative to the start of the recording,
+        the position is in the units of the window, and pressed is 1 if the left button is pressed.
+        `sample` is called once per iteration of the response loop and only stores a sample
+        when the period has passed, so the recording costs one comparison on most iterations.
+        The start position, the initiation time and the path length are updated with each sample,
+        so they still cover the whole recording after the oldest samples were overwritten.
+    '''
+
+    def __init__(self, mouse, period:float, capacity:int = 10000, threshold:float = 0.01):
+
+        if capacity < 1:
+            raise ValueError("The capacity should be at least 1")
+
+        self.mouse = mouse
+        self.period = period
+        self.capacity = capacity
+        self.threshold = threshold
+        self.buffer = np.zeros((capacity, 4))
+        self.reset(0)
+
+    def reset(self, start_time:float):
+        '''Clear the buffer and start a new recording
+
+        Args:
+            start_time (float): The start time of the recording, from psychopy's core.getTime().
+        '''
+
+        self.start_time = start_time
+        self.next_time = start_time
+        self.count = 0
+        self.first = None
+        self.last = None
+        self.initiation_time = None
+        self.path_length = 0.0
+
+    def sample(self, now:float):
+        '''Store a sample if the sampling period has passed
+
+        Args:
+            now (float): The current time, from psychopy's core.getTime().
+        '''
+
+        if now < self.next_time:
+            return
+
+        x, y = self.mouse.getPos()
+        row = self.buffer[self.count % self.capacity]
+        row[0] = now - self.start_time
+        row[1] = x
+        row[2] = y
+        row[3] = self.mouse.getPressed()[0]
+
+        self.count += 1
+        if self.first is None:
+            self.first = (x, y)
+        else:
+            self.path_length += np.hypot(x - self.last[0], y - self.last[1])
+            if self.initiation_time is None and np.hypot(x - self.first[0], y - self.first[1]) > self.threshold:
+                self.initiation_time = float(row[0])
+        self.last = (x, y)
+        # skip the missed samples rather than catching up
+        self.next_time = max(self.next_time + self.period, now)
+
+    def samples(self):
+        '''Get the recorded samples in time order
+
+        Returns:
+            numpy.ndarray: the samples, one row of [time, x, y, pressed] per sample
+        '''
+
+        if self.count <= self.capacity:
+            return self.buffer[:self.count].copy()
+        start = self.count % self.capacity
+        return np.concatenate([self.buffer[start:], self.buffer[:start]])
+
+    @property
+    def dropped_samples(self):
+        '''The number of samples that were overwritten'''
+        return max(0, self.count - self.capacity)
+
+    def measures(self, threshold:float = None):
+        '''Calculate the trajectory measures
+
+        Args:
+            threshold (float, optional): The distance from the start position that counts as movement,
+                in the units of the window. Defaults to None (the threshold of the tracker).
+
+        Returns:
+            dict: the initiation time, the path length, the maximum deviation from the straight line
+                between the first and the last position (None if there are no samples), and the number of dropped samples.
+                Once samples were dropped, the measures that need all samples (the maximum deviation, 
+                and the initiation time with another threshold than the one of the tracker) are NaN.
+        '''
+
+        samples = self.samples()
+        if len(samples) == 0:
+            return {"initiation_time": None, "path_length": None, "max_deviation": None, "dropped_samples": 0}
+
+        t = samples[:, 0]
+        xy = samples[:, 1:3]
+        dropped = self.dropped_samples
+
+        # the first sample that moved away from the start position
+        if threshold is None or threshold == self.threshold:
+            initiation_time = self.initiation_time
+        elif dropped > 0:
+            initiation_time = np.nan
+        else:
+            moved = np.flatnonzero(np.hypot(*(xy - xy[0]).T) > threshold)
+            initiation_time = float(t[moved[0]]) if len(moved) > 0 else None
+
+        # the perpendicular distance from the line between the first and the last position
+        if dropped > 0:
+            max_deviation = np.nan
+        else:
+            line = xy[-1] - xy[0]
+            offset = xy - xy[0]
+            norm = np.hypot(*line)
+            if norm > 0:
+                deviation = (line[0]*offset[:, 1] - line[1]*offset[:, 0])/norm
+            else:
+                deviation = np.hypot(*offset.T)
+            max_deviation = float(deviation[np.argmax(np.abs(deviation))])
+
+        return {
+            "initiation_time": initiation_time,
+            "path_length": float(self.path_length),
+            "max_deviation": max_deviation,
+            "dropped_samples": dropped
+        }
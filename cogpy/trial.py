@@ -4,26 +4,64 @@ This function is inspired by jsPsych, in which you can manipulate the presentati
 
 from psychopy import core, event
 from .layout import stimBoxes
+from .tracking import mouseTracker
+from .gaze import hit_test, fixationDetector
+from .profiling import profiled, span, total
+from .heartbeat import beat
 import numpy as np
 
+def choice_buttons(win, choices):
+    ''' Create the buttons of a button trial
+
+    Args:
+        win (Any): the window object from psychopy
+        choices (list|object): the labels of the buttons, or the boxes (e.g., a stimBoxes) that are used as buttons
+
+    Returns:
+        stimBoxes: the buttons
+    '''
+    
+    if choices is None:
+        raise ValueError("You must provide at least one button")
+    elif isinstance(choices, list) and len(choices) > 0 and all(isinstance(x, str) for x in choices):
+        width = 0.08
+        boxW = (np.max([len(e) for e in choices]) + 2) * 0.5 * width
+        buttons = stimBoxes(
+            win, setsize = len(choices), layout="line", 
+            center = [0, -0.4], spacing=width*0.5, 
+            width = boxW, height = width)
+        buttons.stim_text(text = choices, height = width*0.8, color=[-1,-1,-1])
+        return buttons
+    elif hasattr(choices, "boxes"):
+        return choices
+    else:
+        raise ValueError("if the response type is button, the choices must be either a list of strings or stimBoxes")
+
 class trial(object):
     ''' Display stimuli and collect responses
 
         Args:
             win (object): the window object from psychopy
             stimuli (list): a list of stimuli objects
-            resp_type (str, optional): the type of response. Defaults to "key".
+            resp_type (str, optional): the type of response, one of "key", "button", or "gaze". Defaults to "key".
             choices (list | object | None, optional): the choices for the response. Defaults to None.
+                If the response type is gaze, the choices should be stimBoxes whose boxes are the areas of interest.
             resp_start (int, optional): the time before the response is allowed. Defaults to 0.
             resp_end_trial (bool, optional): whether the trial ends after the response. Defaults to True.
             duration (float, optional): the maximum duration of the trial. Defaults to float('inf').
             post_trial_gap (float, optional): the time after the trial. Defaults to 0.
+            track_mouse (bool, optional): whether to record the mouse trajectory in button trials. Defaults to False.
+            track_rate (float | None, optional): the sampling rate of the mouse trajectory in Hz. 
+                Defaults to None (once per frame).
+            track_capacity (int, optional): the maximum number of samples kept in the trajectory. Defaults to 10000.
+            gaze_source (gazeSource | None, optional): the source of gaze samples for gaze responses. Defaults to None.
+            fixation (float, optional): the fixation duration in seconds that selects a box in gaze responses. Defaults to 0.3.
 
         Raises:
             ValueError: The response type is not recognized
         '''
     
-    def __init__(self, win, stimuli:list, resp_type = "key", choices:list|object|None=None, resp_start=0, resp_end_trial=True, duration=float('inf'), post_trial_gap=0, quit_key="escape"):
+    def __init__(self, win, stimuli:list, resp_type = "key", choices:list|object|None=None, resp_start=0, resp_end_trial=True, duration=float('inf'), post_trial_gap=0, quit_key="escape", track_mouse=False, track_rate=None, track_capacity=10000, gaze_source=None, fixation=0.3):
         
         self.win = win
         self.stimuli = stimuli
@@ -36,11 +74,24 @@ class trial(object):
         self.post_trial_gap = post_trial_gap
         self.response = None
         self.rt = None
+        self.onset = None
+        self.offset = None
+        self.poll_rate = None
+        self.dropped_frames = None
+        self.track_mouse = track_mouse
+        self.track_rate = track_rate
+        self.track_capacity = track_capacity
+        self.tracker = None
+        self.gaze_source = gaze_source
+        self.fixation = fixation
         
         
-        if resp_type not in ["key", "button"]:
+        if resp_type not in ["key", "button", "gaze"]:
             raise ValueError("The response type is not recognized")
+        if resp_type == "gaze" and gaze_source is None:
+            raise ValueError("A gaze source should be provided for gaze responses")
     
+    @profiled("trial.key_response")
     def __key_response(self):
         
         # correct the choices
@@ -49,110 +100,216 @@ class trial(object):
         
         # get the start time of the trial
         start_time = core.getTime() 
+        self.onset = start_time
         
         # Present stimulation but prohibit response  
         for stim in self.stimuli:
             stim.draw()
 
-        self.win.flip()
-        core.wait(self.resp_start)
+        with span("trial.flip"):
+            self.win.flip()
+        with span("trial.lockout"):
+            core.wait(self.resp_start)
         
         # initialize the loop and mouse
         loop = True
         
         # Present stimulation and allow response
-        while loop:
-            
-            # get the response
-            keys = event.getKeys()
-            
-            # check if the quit key is pressed
-            if self.quit_key in keys:
-                self.win.close()
-                core.quit()
-            
-            # check if the response is correct
-            if self.response is None and set(keys).intersection(self.choices):
-                self.response = keys
-                self.rt = core.getTime() - start_time
+        polls = 0
+        loop_start = core.getTime()
+        poll = total("trial.poll")
+        with span("trial.key_loop"):
+            while loop:
+                polls += 1
+                beat()
+                
+                # get the response
+                with poll:
+                    keys = event.getKeys()
+                
+                # check if the quit key is pressed
+                if self.quit_key in keys:
+                    self.win.close()
+                    core.quit()
                 
-                if self.resp_end_trial:
+                # check if the response is correct
+                if self.response is None and set(keys).intersection(self.choices):
+                    self.response = keys
+                    self.rt = core.getTime() - start_time
+                    
+                    if self.resp_end_trial:
+                        loop = False
+                            
+                # check if the time is over
+                if core.getTime() - start_time > self.duration:
                     loop = False
-                        
-            # check if the time is over
-            if core.getTime() - start_time > self.duration:
-                loop = False
-
+        poll.record()
+        
+        # the number of iterations of the response loop per second
+        self.poll_rate = polls/max(core.getTime() - loop_start, 1e-9)
     
+    @profiled("trial.button_response")
     def __button_response(self):
         
-        # correct the choices
-        if self.choices is None:
-            raise ValueError("You must provide at least one button")
-        elif isinstance(self.choices, object):
-            self.buttons = self.choices
-        elif isinstance(self.choices, str):
-            raise ValueError("if the response type is button, the choices must be either a list of strings or stimBoxes")
-        elif all(isinstance(x, str) for x in self.choices):
-            width = 0.08
-            boxW = (np.max([len(e) for e in self.choices]) + 2) * 0.5 * width
-            self.buttons = stimBoxes(
-                self.win, setsize = len(self.choices), layout="line", 
-                center = [0, -0.4], spacing=width*0.5, 
-                width = boxW, height = width)
-            self.buttons.stim_text(text = self.choices, height = width*0.8, color=[-1,-1,-1])
-        else:
-            raise ValueError("if the response type is button, the choices must be either a list of strings or stimBoxes")
-            
+        # create the buttons
+        self.buttons = choice_buttons(self.win, self.choices)
         
         # get the start time of the trial
         start_time = core.getTime() 
+        self.onset = start_time
         
         # Present stimulation but prohibit response
         for stim in self.stimuli:
             stim.draw()
         self.buttons.draw()
-        self.win.flip()
-        core.wait(self.resp_start)
+        with span("trial.flip"):
+            self.win.flip()
+        with span("trial.lockout"):
+            core.wait(self.resp_start)
 
         # initialize the loop
         loop = True
         mouse = event.Mouse()
         
+        # initialize the mouse trajectory
+        if self.track_mouse:
+            period = self.win.monitorFramePeriod if self.track_rate is None else 1/self.track_rate
+            if self.tracker is None:
+                self.tracker = mouseTracker(mouse, period, self.track_capacity)
+            self.tracker.mouse = mouse
+            self.tracker.period = period
+            self.tracker.reset(start_time)
+        
         # Present stimulation and allow response
-        while loop:
-            
-            # check if the quit key is pressed
-            if self.quit_key in event.getKeys():
-                self.win.close()
-                core.quit()
-            
-            for button in self.buttons.boxes:
+        polls = 0
+        loop_start = core.getTime()
+        poll = total("trial.poll")
+        with span("trial.button_loop"):
+            while loop:
+                polls += 1
+                beat()
                 
-                if mouse.isPressedIn(self.buttons.boxes[button], buttons=[0]):
-                    try:
-                        self.response = self.buttons.text[button].text
-                    except:
-                        self.response = self.buttons.images[button].image
-                    self.rt = core.getTime() - start_time
+                # check if the quit key is pressed
+                with poll:
+                    keys = event.getKeys()
+                if self.quit_key in keys:
+                    self.win.close()
+                    core.quit()
+                
+                # record the mouse trajectory
+                if self.track_mouse:
+                    self.tracker.sample(core.getTime())
+                
+                with poll:
+                    for button in self.buttons.boxes:
+                        
+                        if mouse.isPressedIn(self.buttons.boxes[button], buttons=[0]):
+                            try:
+                                self.response = self.buttons.text[button].text
+                            except:
+                                self.response = self.buttons.image_names[button]
+                            self.rt = core.getTime() - start_time
+                            
+                            if self.resp_end_trial:
+                                loop = False# initialize the loop
                     
-                    if self.resp_end_trial:
-                        loop = False# initialize the loop
+                # check if the time is over
+                if core.getTime() - start_time > self.duration:
+                    loop = False
+        poll.record()
+        
+        # the number of iterations of the response loop per second
+        self.poll_rate = polls/max(core.getTime() - loop_start, 1e-9)
+    
+    @profiled("trial.gaze_response")
+    def __gaze_response(self):
+        
+        # correct the choices
+        if not isinstance(self.choices, stimBoxes):
+            raise ValueError("if the response type is gaze, the choices must be stimBoxes")
+        
+        # the geometry of the areas of interest
+        names, centers, sizes = self.choices.geometry()
+        detector = fixationDetector(self.fixation)
+        
+        # get the start time of the trial
+        start_time = core.getTime() 
+        self.onset = start_time
+        
+        # Present stimulation but prohibit response
+        for stim in self.stimuli:
+            stim.draw()
+        with span("trial.flip"):
+            self.win.flip()
+        with span("trial.lockout"):
+            core.wait(self.resp_start)
+        
+        # discard the samples recorded before the response is allowed
+        self.gaze_source.poll()
+        
+        # initialize the loop
+        loop = True
+        
+        # Present stimulation and allow response, processing the samples of each frame in one batch
+        polls = 0
+        loop_start = core.getTime()
+        poll = total("trial.poll")
+        with span("trial.gaze_loop"):
+            while loop:
+                polls += 1
+                beat()
+                
+                # check if the quit key is pressed
+                with poll:
+                    keys = event.getKeys()
+                if self.quit_key in keys:
+                    self.win.close()
+                    core.quit()
+                
+                with poll:
+                    samples = self.gaze_source.poll()
+                if self.response is None and len(samples) > 0:
+                    fixation = detector.update(samples[:, 0], hit_test(samples[:, 1:3], centers, sizes))
+                    if fixation is not None:
+                        self.response = names[fixation[0]]
+                        self.rt = fixation[2] - start_time
+                        
+                        if self.resp_end_trial:
+                            loop = False
+                
+                # check if the time is over
+                if core.getTime() - start_time > self.duration:
+                    loop = False
                 
-            # check if the time is over
-            if core.getTime() - start_time > self.duration:
-                loop = False
+                if loop:
+                    for stim in self.stimuli:
+                        stim.draw()
+                    with span("trial.flip"):
+                        self.win.flip()
+        poll.record()
+        
+        # the number of iterations of the response loop per second
+        self.poll_rate = polls/max(core.getTime() - loop_start, 1e-9)
     
+    @profiled("trial.run")
     def run(self):
         
         if self.resp_type == "key":
             self.__key_response()
         elif self.resp_type == "button":
             self.__button_response()
+        elif self.resp_type == "gaze":
+            self.__gaze_response()
+        
+        self.offset = core.getTime()
+        # psychopy only counts the dropped frames while the frame intervals are recorded
+        self.dropped_frames = self.win.nDroppedFrames if getattr(self.win, "recordFrameIntervals", False) else None
         
         if self.post_trial_gap > 0:
-            self.win.flip()
-            core.wait(self.post_trial_gap)
+            with span("trial.flip"):
+                self.win.flip()
+            with span("trial.post_trial_gap"):
+                core.wait(self.post_trial_gap)
     
     def update_stimuli(self, win, stimuli:list):
         ''' Update the stimuli
@@ -168,14 +325,26 @@ class trial(object):
         # reset the response
         self.response = None
         self.rt = None
+        self.onset = None
+        self.offset = None
+        if self.tracker is not None:
+            self.tracker.reset(0)
     
     def get_response(self):
         ''' Get the response
 
         Returns:
-            dict: the response and the response time
+            dict: the response and the response time.
+                If the mouse trajectory is recorded, the dict also contains the trajectory 
+                (one row of [time, x, y, pressed] per sample) and the trajectory measures.
         '''
-        return {
+        result = {
             "response":self.response,
             "rt":self.rt
-        }
\ No newline at end of file
+        }
+        
+        if self.tracker is not None:
+            result["trajectory"] = self.tracker.samples()
+            result.update(self.tracker.measures())
+        
+        return result
\ No newline at end of file
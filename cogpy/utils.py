@@ -1,31 +1,147 @@
 import sys
+import threading
 
 # Windows-specific imports
 if sys.platform == "win32":
     import ctypes
 # macOS-specific imports
 elif sys.platform == "darwin":
-    from Quartz import CGEventSourceKeyState, kCGEventSourceStateHIDSystemState
+    from Quartz import CGEventSourceFlagsState, kCGEventSourceStateHIDSystemState
 # Linux-specific imports
 elif sys.platform.startswith("linux"):
     from Xlib.display import Display
+    from Xlib import X
+
+
+class keyboardMonitor(object):
+    ''' Monitor the Caps Lock and modifier keys with one persistent connection
+
+    Args:
+        interval (float, optional): the time between two refreshes in seconds. Defaults to 0.05.
+        start (bool, optional): whether to start the background thread. Defaults to True.
+
+    Description:
+        The monitor keeps one connection to the keyboard (an X display on Linux, User32.dll on Windows,
+        the HID event source on macOS) and refreshes the state on a background thread.
+        Reading the state only reads the cached value, so it can be used in any response loop.
+        Without the background thread, call `refresh` to update the state.
+    '''
+
+    CAPSLOCK = 1
+    SHIFT = 2
+    CTRL = 4
+    ALT = 8
+
+    def __init__(self, interval:float = 0.05, start:bool = True):
+
+        self.interval = interval
+        self.state = 0
+        self.thread = None
+        self.stopped = threading.Event()
+
+        # open the connection
+        if sys.platform == "win32":
+            self.user32 = ctypes.WinDLL("User32.dll")
+        elif sys.platform == "darwin":
+            pass
+        elif sys.platform.startswith("linux"):
+            self.display = Display()
+            self.root = self.display.screen().root
+        else:
+            raise OSError("Unsupported operating system for checking the keyboard state.")
+
+        self.refresh()
+        if start:
+            self.start()
+
+    def refresh(self):
+        '''Read the keyboard state from the connection'''
+
+        state = 0
+        # Windows
+        if sys.platform == "win32":
+            if self.user32.GetKeyState(0x14) & 1: state |= self.CAPSLOCK
+            if self.user32.GetAsyncKeyState(0x10) & 0x8000: state |= self.SHIFT
+            if self.user32.GetAsyncKeyState(0x11) & 0x8000: state |= self.CTRL
+            if self.user32.GetAsyncKeyState(0x12) & 0x8000: state |= self.ALT
+        # macOS
+        elif sys.platform == "darwin":
+            flags = CGEventSourceFlagsState(kCGEventSourceStateHIDSystemState)
+            if flags & 0x10000: state |= self.CAPSLOCK
+            if flags & 0x20000: state |= self.SHIFT
+            if flags & 0x40000: state |= self.CTRL
+            if flags & 0x80000: state |= self.ALT
+        # Linux
+        elif sys.platform.startswith("linux"):
+            if self.display.get_keyboard_control().led_mask & 1: state |= self.CAPSLOCK
+            mask = self.root.query_pointer().mask
+            if mask & X.ShiftMask: state |= self.SHIFT
+            if mask & X.ControlMask: state |= self.CTRL
+            if mask & X.Mod1Mask: state |= self.ALT
+
+        # a single assignment, so readers never see a partial state
+        self.state = state
+
+    def start(self):
+        '''Start refreshing the state on a background thread'''
+
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''Stop the background thread'''
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        '''Stop the background thread and close the connection'''
+
+        self.stop()
+        if sys.platform.startswith("linux"):
+            self.display.close()
+
+    def __run(self):
+
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+
+    @property
+    def capslock(self):
+        return bool(self.state & self.CAPSLOCK)
+
+    @property
+    def shift(self):
+        return bool(self.state & self.SHIFT)
+
+    @property
+    def ctrl(self):
+        return bool(self.state & self.CTRL)
+
+    @property
+    def alt(self):
+        return bool(self.state & self.ALT)
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+def get_keyboard_monitor():
+    '''Get the shared keyboard monitor, starting it on the first call.'''
+    global _monitor
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = keyboardMonitor()
+    return _monitor
 
 def is_capslock_on():
     """Check if Caps Lock is on, cross-platform."""
-    # Windows
-    if sys.platform == "win32":
-        hll_dll = ctypes.WinDLL("User32.dll")
-        return hll_dll.GetKeyState(0x14) == 1
-    # macOS
-    elif sys.platform == "darwin":
-        return CGEventSourceKeyState(kCGEventSourceStateHIDSystemState, 57)
-    # Linux
-    elif sys.platform.startswith("linux"):
-        display = Display()
-        return display.get_keyboard_control().led_mask & 1 != 0
-    # Unsupported OS
-    else:
-        raise OSError("Unsupported operating system for checking Caps Lock status.")
+    return get_keyboard_monitor().capslock
 
 # Usage example
 if __name__ == "__main__":
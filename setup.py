@@ -12,12 +12,17 @@ setup(
     packages=find_packages(),
     install_requires=[
         'psychopy',
-        'pandas'
+        'pandas',
+        'pillow'
     ],
     extras_require={
         "Windows": [],  # No additional dependency for Windows
         "macOS": ["pyobjc-framework-Quartz"],
         "Linux": ["python-xlib"],
+        "yaml": ["pyyaml"],
+    },
+    entry_points={
+        "console_scripts": ["cogpy-monitor=cogpy.telemetry:main"],
     },
     classifiers=[
         'Programming Language :: Python :: 3',